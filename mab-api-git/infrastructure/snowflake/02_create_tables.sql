@@ -34,7 +34,7 @@ CREATE TABLE IF NOT EXISTS variants (
 -- Raw Metrics (append-only, auditoria)
 -- ============================================
 CREATE TABLE IF NOT EXISTS raw_metrics (
-    id VARCHAR(36) PRIMARY KEY,
+    id VARCHAR(36) DEFAULT UUID_STRING() PRIMARY KEY,
     variant_id VARCHAR(36) NOT NULL REFERENCES variants(id),
     metric_date DATE NOT NULL,
     sessions BIGINT NOT NULL DEFAULT 0,
@@ -50,7 +50,7 @@ CREATE TABLE IF NOT EXISTS raw_metrics (
 -- Daily Metrics (dados limpos para cálculo)
 -- ============================================
 CREATE TABLE IF NOT EXISTS daily_metrics (
-    id VARCHAR(36) PRIMARY KEY,
+    id VARCHAR(36) DEFAULT UUID_STRING() PRIMARY KEY,
     variant_id VARCHAR(36) NOT NULL REFERENCES variants(id),
     metric_date DATE NOT NULL,
     sessions BIGINT NOT NULL DEFAULT 0,
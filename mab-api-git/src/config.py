@@ -1,5 +1,6 @@
 """Application configuration using Pydantic Settings."""
 
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
 
@@ -13,6 +14,7 @@ class Settings(BaseSettings):
     snowflake_warehouse: str
     snowflake_database: str = "activeview_mab"
     snowflake_schema: str = "experiments"
+    snowflake_pool_size: int = 4
 
     # API configuration
     api_host: str = "0.0.0.0"
@@ -23,9 +25,18 @@ class Settings(BaseSettings):
     max_window_days: int = 30
     min_impressions: int = 10000
     thompson_samples: int = 10000
+    thompson_workers: int = 1
     prior_alpha: int = 1
     prior_beta: int = 99
+
+    # Ingestion
+    metrics_copy_threshold: int = 1000
     
+    # Caching (seconds)
+    experiment_cache_ttl: int = 30
+    allocation_cache_ttl: int = 60
+    allocation_refresh_interval: int = 0
+
     # Logging
     log_level: str = "INFO"
     
@@ -33,6 +44,17 @@ class Settings(BaseSettings):
     rate_limit_enabled: bool = True
     rate_limit_default_max: int = 100
     rate_limit_default_window: int = 60
+    rate_limit_exact: bool = False
+
+    @model_validator(mode="after")
+    def validate_refresh_interval(self) -> "Settings":
+        """Refreshed allocations must be rewritten before their cache entry expires."""
+        if 0 < self.allocation_cache_ttl <= self.allocation_refresh_interval:
+            raise ValueError(
+                f"allocation_refresh_interval ({self.allocation_refresh_interval}) "
+                f"must be below allocation_cache_ttl ({self.allocation_cache_ttl})"
+            )
+        return self
 
     class Config:
         env_file = ".env"
@@ -1,12 +1,32 @@
 """Multi-Armed Bandit Optimization API."""
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
 
 from src.routers import health_router, experiments_router
 from src.config import settings
 from src.rate_limit import RateLimitMiddleware
 from src.middleware import RequestLoggingMiddleware
+from src.repositories.database import pool
+from src.services.allocation import run_allocation_refresh
+from src.serialization import OrjsonResponse
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the optional allocation refresh; close pooled Snowflake connections on shutdown."""
+    refresh_task = None
+    if settings.allocation_refresh_interval > 0:
+        refresh_task = asyncio.create_task(
+            run_allocation_refresh(settings.allocation_refresh_interval)
+        )
+    yield
+    if refresh_task is not None:
+        refresh_task.cancel()
+    pool.close()
+
 
 # API metadata for documentation
 app = FastAPI(
@@ -58,6 +78,7 @@ Response headers include:
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 
@@ -79,7 +100,7 @@ async def global_exception_handler(request: Request, exc: Exception):
         method=request.method,
     )
     
-    return JSONResponse(
+    return OrjsonResponse(
         status_code=500,
         content={"detail": "Internal server error", "type": type(exc).__name__},
     )
@@ -91,7 +112,7 @@ app.include_router(experiments_router)
 
 
 # Root endpoint
-@app.get("/", include_in_schema=False)
+@app.get("/", include_in_schema=False, response_class=OrjsonResponse)
 async def root():
     """Redirect to documentation."""
     return {
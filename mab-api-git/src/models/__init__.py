@@ -7,7 +7,12 @@ from src.models.experiment import (
     VariantResponse,
 )
 from src.models.metrics import MetricInput, MetricsBatchRequest, MetricsResponse
-from src.models.allocation import AllocationResponse, VariantAllocation, VariantMetrics
+from src.models.allocation import (
+    AllocationResponse,
+    BatchAllocationResponse,
+    VariantAllocation,
+    VariantMetrics,
+)
 
 __all__ = [
     "ExperimentCreate",
@@ -18,6 +23,7 @@ __all__ = [
     "MetricsBatchRequest",
     "MetricsResponse",
     "AllocationResponse",
+    "BatchAllocationResponse",
     "VariantAllocation",
     "VariantMetrics",
 ]
@@ -84,3 +84,11 @@ class AllocationResponse(BaseModel):
             ]
         }
     }
+
+
+class BatchAllocationResponse(BaseModel):
+    """Schema for the multi-experiment allocation response."""
+
+    experiments: list[AllocationResponse] = Field(
+        ..., description="Allocation per experiment, in request order"
+    )
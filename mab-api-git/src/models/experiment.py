@@ -41,18 +41,21 @@ class ExperimentCreate(BaseModel):
     )
 
     @model_validator(mode="after")
-    def validate_has_control(self) -> "ExperimentCreate":
-        """Ensure at least one variant is marked as control."""
-        has_control = any(v.is_control for v in self.variants)
+    def validate_variants(self) -> "ExperimentCreate":
+        """
+        Ensure at least one variant is a control and names are unique.
+        
+        Both rules are checked in a single pass over the variants.
+        """
+        names = set()
+        has_control = False
+        for v in self.variants:
+            has_control |= v.is_control
+            names.add(v.name)
+        
         if not has_control:
             raise ValueError("At least one variant must be marked as control (is_control=True)")
-        return self
-
-    @model_validator(mode="after")
-    def validate_unique_names(self) -> "ExperimentCreate":
-        """Ensure variant names are unique within the experiment."""
-        names = [v.name for v in self.variants]
-        if len(names) != len(set(names)):
+        if len(names) != len(self.variants):
             raise ValueError("Variant names must be unique within an experiment")
         return self
 
@@ -1,6 +1,10 @@
 """Rate limiting middleware and utilities."""
 
+import math
+import threading
 import time
+from array import array
+from bisect import bisect_right
 from collections import defaultdict
 from datetime import date
 from typing import Callable
@@ -9,12 +13,23 @@ from fastapi import HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 
+from src.cache import TTLCache
+from src.config import settings
 from src.logging_config import logger
 
 
 class RateLimiter:
     """
-    Simple in-memory rate limiter using sliding window.
+    Simple in-memory rate limiter using a sliding window approximation.
+    
+    Keeps two fixed-window counters per key (previous and current window)
+    and weights the previous one by how much of it still overlaps the
+    sliding window:
+    
+        count = current + previous * (1 - elapsed / window)
+    
+    O(1) memory and CPU per key instead of one timestamp per request, at the
+    cost of assuming requests in the previous window were evenly spread.
     
     For production, consider Redis-based rate limiting for:
     - Distributed deployments
@@ -23,22 +38,15 @@ class RateLimiter:
     """
 
     def __init__(self):
-        # Structure: {key: [(timestamp, count), ...]}
-        self._requests: dict[str, list[tuple[float, int]]] = defaultdict(list)
-
-    def _clean_old_requests(self, key: str, window_seconds: int) -> None:
-        """Remove requests outside the current window."""
-        now = time.time()
-        cutoff = now - window_seconds
-        self._requests[key] = [
-            (ts, count) for ts, count in self._requests[key] if ts > cutoff
-        ]
+        # Structure: {endpoint: {key: [previous_count, current_count, window_start]}}
+        self._requests: dict[str, dict[str, list[int]]] = defaultdict(dict)
 
     def is_allowed(
         self,
         key: str,
         max_requests: int,
         window_seconds: int,
+        endpoint: str = "",
     ) -> tuple[bool, int, int]:
         """
         Check if request is allowed under rate limit.
@@ -47,27 +55,96 @@ class RateLimiter:
             key: Unique identifier (IP, API key, etc)
             max_requests: Maximum requests allowed in window
             window_seconds: Time window in seconds
+            endpoint: Endpoint pattern the limit applies to (limits are
+                tracked separately per endpoint)
         
         Returns:
             Tuple of (is_allowed, remaining_requests, reset_seconds)
         """
-        now = time.time()
-        self._clean_old_requests(key, window_seconds)
+        # Monotonic whole seconds: immune to wall-clock (NTP) jumps
+        now = int(time.monotonic())
+        clients = self._requests[endpoint]
+        state = clients.get(key)
+        if state is None:
+            state = clients[key] = [0, 0, now]
+        previous, current, window_start = state
+
+        elapsed = now - window_start
+        if elapsed >= window_seconds:
+            # Roll forward; after a gap of 2+ windows both counters are stale
+            previous = current if elapsed < 2 * window_seconds else 0
+            current = 0
+            window_start = now - (elapsed % window_seconds)
+            elapsed = now - window_start
+
+        count = current + previous * (1 - elapsed / window_seconds)
+        reset_seconds = max(1, math.ceil(window_seconds - elapsed))
+
+        if count >= max_requests:
+            state[:] = previous, current, window_start
+            return False, 0, reset_seconds
+
+        # Record this request
+        state[:] = previous, current + 1, window_start
+        remaining = max(0, int(max_requests - count - 1))
 
-        total_requests = sum(count for _, count in self._requests[key])
+        return True, remaining, reset_seconds
 
-        if total_requests >= max_requests:
-            # Calculate reset time
-            if self._requests[key]:
-                oldest_ts = min(ts for ts, _ in self._requests[key])
-                reset_seconds = int(oldest_ts + window_seconds - now)
-            else:
-                reset_seconds = window_seconds
+
+class SlidingLogRateLimiter:
+    """
+    Exact in-memory rate limiter keeping one entry per request in the window.
+    
+    Use when the two-bucket approximation of RateLimiter is not precise
+    enough. Timestamps are whole monotonic seconds since the limiter was created,
+    stored per key in an array('I') (4 bytes per request instead of a boxed
+    float tuple), so expiring old entries is one bisect plus one slice
+    delete. Second resolution means a request may expire up to 1s early.
+    """
+
+    def __init__(self):
+        self._epoch = int(time.monotonic())
+        # Structure: {endpoint: {key: array of request offsets (seconds), ascending}}
+        self._requests: dict[str, dict[str, array]] = defaultdict(dict)
+
+    def is_allowed(
+        self,
+        key: str,
+        max_requests: int,
+        window_seconds: int,
+        endpoint: str = "",
+    ) -> tuple[bool, int, int]:
+        """
+        Check if request is allowed under rate limit.
+        
+        Args:
+            key: Unique identifier (IP, API key, etc)
+            max_requests: Maximum requests allowed in window
+            window_seconds: Time window in seconds
+            endpoint: Endpoint pattern the limit applies to (limits are
+                tracked separately per endpoint)
+        
+        Returns:
+            Tuple of (is_allowed, remaining_requests, reset_seconds)
+        """
+        now = int(time.monotonic()) - self._epoch
+        clients = self._requests[endpoint]
+        timestamps = clients.get(key)
+        if timestamps is None:
+            timestamps = clients[key] = array("I")
+
+        # Drop requests outside the window (entries are in arrival order)
+        expired = bisect_right(timestamps, now - window_seconds)
+        if expired:
+            del timestamps[:expired]
+
+        if len(timestamps) >= max_requests:
+            reset_seconds = max(1, timestamps[0] + window_seconds - now)
             return False, 0, reset_seconds
 
         # Record this request
-        self._requests[key].append((now, 1))
-        remaining = max_requests - total_requests - 1
+        timestamps.append(now)
+        remaining = max_requests - len(timestamps)
 
         return True, remaining, window_seconds
 
@@ -87,25 +164,31 @@ class DailyAllocationLimit:
     def __init__(self, max_per_day: int = 3000):
         self.max_per_day = max_per_day
         self._calls: dict[str, int] = {}
+        # Handlers rodam no threadpool: check() precisa ser atômico
+        self._lock = threading.Lock()
     
-    def check(self) -> tuple[bool, int]:
+    def check(self, cost: int = 1) -> tuple[bool, int]:
         """
-        Verifica se pode fazer mais uma chamada.
+        Verifica se pode fazer mais `cost` cálculos.
+        
+        Args:
+            cost: Número de cálculos da chamada (1 por experimento)
         
         Returns:
             Tuple (is_allowed, remaining)
         """
         today = date.today().isoformat()
         
-        # Limpa dias antigos
-        self._calls = {d: c for d, c in self._calls.items() if d == today}
-        
-        current = self._calls.get(today, 0)
-        if current >= self.max_per_day:
-            return False, 0
-        
-        self._calls[today] = current + 1
-        return True, self.max_per_day - current - 1
+        with self._lock:
+            # Limpa dias antigos
+            self._calls = {d: c for d, c in self._calls.items() if d == today}
+            
+            current = self._calls.get(today, 0)
+            if current + cost > self.max_per_day:
+                return False, 0
+            
+            self._calls[today] = current + cost
+            return True, self.max_per_day - current - cost
     
     def remaining(self) -> int:
         """Retorna quantas chamadas ainda pode fazer hoje."""
@@ -115,20 +198,43 @@ class DailyAllocationLimit:
 
 
 # Global instances
-rate_limiter = RateLimiter()
+rate_limiter = SlidingLogRateLimiter() if settings.rate_limit_exact else RateLimiter()
 daily_allocation_limit = DailyAllocationLimit(max_per_day=3000)
 
+# Only 1 in N rejections per client/endpoint is logged, so a flood of 429s
+# doesn't turn into a flood of synchronous log writes
+REJECTION_LOG_SAMPLE_RATE = 100
+
 
 # Rate limit configurations per endpoint
 RATE_LIMITS = {
     "POST /experiments": {"max_requests": 10, "window_seconds": 60},
     "POST /experiments/{experiment_id}/metrics": {"max_requests": 100, "window_seconds": 60},
     "GET /experiments/{experiment_id}/allocation": {"max_requests": 300, "window_seconds": 60},
+    "GET /experiments/allocations": {"max_requests": 60, "window_seconds": 60},
     "GET /experiments/{experiment_id}/history": {"max_requests": 60, "window_seconds": 60},
     "GET /experiments/{experiment_id}": {"max_requests": 120, "window_seconds": 60},
     "default": {"max_requests": 100, "window_seconds": 60},
 }
 
+# Header values that depend only on the endpoint config, built once so a
+# 429 under attack only formats the dynamic reset value
+_STATIC_HEADERS = {
+    pattern: {
+        "X-RateLimit-Limit": str(config["max_requests"]),
+        "X-RateLimit-Remaining": "0",
+    }
+    for pattern, config in RATE_LIMITS.items()
+}
+
+# (endpoint, key) -> rejections in the current episode. Keys come from
+# X-Forwarded-For and can be spoofed, so entries expire once a client has
+# been quiet for a whole window and the LRU bound caps memory
+_rejection_counts = TTLCache(
+    maxsize=10_000,
+    ttl=max(config["window_seconds"] for config in RATE_LIMITS.values()),
+)
+
 
 def get_rate_limit_key(request: Request) -> str:
     """
@@ -166,12 +272,15 @@ def get_endpoint_pattern(request: Request) -> str:
     return f"{method} {normalized_path}"
 
 
-def check_daily_allocation_limit():
+def check_daily_allocation_limit(cost: int = 1):
     """
     Verifica limite diário do /allocation.
     Levanta HTTPException 429 se excedeu.
+    
+    Args:
+        cost: Número de cálculos da chamada (1 por experimento)
     """
-    is_allowed, remaining = daily_allocation_limit.check()
+    is_allowed, remaining = daily_allocation_limit.check(cost)
     
     if not is_allowed:
         logger.warning(
@@ -211,30 +320,36 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         # Get rate limit config for endpoint
         endpoint_pattern = get_endpoint_pattern(request)
         config = RATE_LIMITS.get(endpoint_pattern, RATE_LIMITS["default"])
+        static_headers = _STATIC_HEADERS.get(endpoint_pattern, _STATIC_HEADERS["default"])
 
         # Check rate limit
         key = get_rate_limit_key(request)
-        full_key = f"{key}:{endpoint_pattern}"
 
         is_allowed, remaining, reset = rate_limiter.is_allowed(
-            full_key,
+            key,
             config["max_requests"],
             config["window_seconds"],
+            endpoint=endpoint_pattern,
         )
 
         if not is_allowed:
-            logger.warning(
-                f"Rate limit exceeded for {key}",
-                extra={
-                    "type": "rate_limit",
-                    "key": key,
-                    "endpoint": endpoint_pattern,
-                    "limit": config["max_requests"],
-                    "window_seconds": config["window_seconds"],
-                },
-            )
+            rejections = _rejection_counts.get((endpoint_pattern, key), 0) + 1
+            _rejection_counts.set((endpoint_pattern, key), rejections)
+            if (rejections - 1) % REJECTION_LOG_SAMPLE_RATE == 0:
+                logger.warning(
+                    f"Rate limit exceeded for {key}",
+                    extra={
+                        "type": "rate_limit",
+                        "key": key,
+                        "endpoint": endpoint_pattern,
+                        "limit": config["max_requests"],
+                        "window_seconds": config["window_seconds"],
+                        "rejections": rejections,
+                    },
+                )
             # Retornar JSONResponse em vez de levantar HTTPException
             # porque BaseHTTPMiddleware não propaga HTTPException corretamente
+            reset_header = str(reset)
             return JSONResponse(
                 status_code=429,
                 content={
@@ -246,18 +361,21 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
                     }
                 },
                 headers={
-                    "X-RateLimit-Limit": str(config["max_requests"]),
-                    "X-RateLimit-Remaining": "0",
-                    "X-RateLimit-Reset": str(reset),
-                    "Retry-After": str(reset),
+                    **static_headers,
+                    "X-RateLimit-Reset": reset_header,
+                    "Retry-After": reset_header,
                 },
             )
 
+        # Client is back under the limit: next rejection starts a new episode
+        if _rejection_counts:
+            _rejection_counts.pop((endpoint_pattern, key))
+
         # Process request
         response = await call_next(request)
 
         # Add rate limit headers to response
-        response.headers["X-RateLimit-Limit"] = str(config["max_requests"])
+        response.headers["X-RateLimit-Limit"] = static_headers["X-RateLimit-Limit"]
         response.headers["X-RateLimit-Remaining"] = str(remaining)
         response.headers["X-RateLimit-Reset"] = str(reset)
 
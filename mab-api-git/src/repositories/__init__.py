@@ -1,14 +1,29 @@
 """Database repositories for the MAB API."""
 
-from src.repositories.database import get_connection, get_cursor, execute_query, execute_write
+from src.repositories.database import (
+    bind_params,
+    bind_many,
+    get_connection,
+    get_cursor,
+    request_connection_scope,
+    transaction,
+    execute_query,
+    stream_query,
+    execute_write,
+)
 from src.repositories.experiment import ExperimentRepository, VariantRepository
 from src.repositories.metrics import MetricsRepository
 from src.repositories.allocation_history import AllocationHistoryRepository
 
 __all__ = [
+    "bind_params",
+    "bind_many",
     "get_connection",
     "get_cursor",
+    "request_connection_scope",
+    "transaction",
     "execute_query",
+    "stream_query",
     "execute_write",
     "ExperimentRepository",
     "VariantRepository",
@@ -1,10 +1,10 @@
 """Repository for allocation history operations."""
 
 import json
-import uuid
 from datetime import datetime
 
 from src.repositories.database import execute_write
+from src.repositories.ids import generate_ids
 from src.sql import AllocationHistoryQueries
 
 
@@ -38,7 +38,7 @@ class AllocationHistoryRepository:
         Returns:
             Allocation history ID
         """
-        history_id = str(uuid.uuid4())
+        (history_id,) = generate_ids(1)
         
         total_impressions = sum(v["impressions"] for v in variants)
         total_clicks = sum(v["clicks"] for v in variants)
@@ -58,6 +58,7 @@ class AllocationHistoryRepository:
                 "total_clicks": total_clicks,
                 "allocations": json.dumps(variants),
             },
+            query_name="save_allocation",
         )
 
         return history_id
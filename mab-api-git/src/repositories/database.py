@@ -1,8 +1,12 @@
 """Snowflake database connection management."""
 
+import queue
+import re
 import time
 from contextlib import contextmanager
-from typing import Generator, Any
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import AsyncGenerator, Generator, Any
 
 import snowflake.connector
 from snowflake.connector import SnowflakeConnection
@@ -10,8 +14,14 @@ from snowflake.connector import SnowflakeConnection
 from src.config import settings
 from src.logging_config import logger, log_db_query, log_error
 
+# Matches pyformat placeholders: %(name)s
+_PYFORMAT_PARAM = re.compile(r"%\((\w+)\)s")
 
-def get_connection_params() -> dict[str, str]:
+# Quoted literals/identifiers (group 1) or runs of whitespace and -- comments
+_SQL_TOKEN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|(?:--[^\n]*|\s)+")
+
+
+def get_connection_params() -> dict[str, Any]:
     """Get Snowflake connection parameters from settings."""
     return {
         "account": settings.snowflake_account,
@@ -20,26 +30,122 @@ def get_connection_params() -> dict[str, str]:
         "warehouse": settings.snowflake_warehouse,
         "database": settings.snowflake_database,
         "schema": settings.snowflake_schema,
+        # Server-side binding: the SQL text stays constant across calls,
+        # so Snowflake can reuse the compiled plan
+        "paramstyle": "qmark",
+        # Single-statement writes commit with the statement itself (one
+        # round-trip); multi-statement writes opt out per connection
+        "autocommit": True,
     }
 
 
-@contextmanager
-def get_connection() -> Generator[SnowflakeConnection, None, None]:
+def _normalize_sql(sql: str) -> str:
+    """Collapse whitespace and drop comments, leaving quoted text untouched."""
+    return _SQL_TOKEN.sub(lambda m: m.group(1) or " ", sql).strip()
+
+
+@lru_cache(maxsize=256)
+def _compile_query(query: str) -> tuple[str, tuple[str, ...]]:
     """
-    Context manager for Snowflake connections.
+    Convert a pyformat query to qmark SQL plus its ordered parameter names.
     
-    Usage:
-        with get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1")
+    Runs once per query text. The result is normalized so the statement
+    sent to Snowflake is compact and byte-identical across calls, which the
+    result cache requires for a hit.
+
+    This is as close to prepared statements as Snowflake gets: there is no
+    PREPARE/EXECUTE, so a per-connection registry keyed by query_name would
+    have nothing to hold. Identical text plus server-side binding is what
+    lets repeated executions skip recompilation.
     """
-    start_time = time.perf_counter()
-    conn = None
+    names = tuple(_PYFORMAT_PARAM.findall(query))
+    return _normalize_sql(_PYFORMAT_PARAM.sub("?", query)), names
+
+
+def bind_params(query: str, params: dict | None = None) -> tuple[str, tuple]:
+    """
+    Translate a pyformat query and its dict params for qmark execution.
     
-    try:
-        conn = snowflake.connector.connect(**get_connection_params())
-        duration_ms = (time.perf_counter() - start_time) * 1000
+    Queries in src.sql keep readable %(name)s placeholders; the translation
+    is cached per query text, so only the parameter tuple is built per call.
+    
+    Args:
+        query: SQL query string with %(name)s placeholders
+        params: Query parameters
+        
+    Returns:
+        Tuple of (qmark SQL, positional parameters)
+    """
+    sql, names = _compile_query(query)
+    params = params or {}
+    return sql, tuple(params[name] for name in names)
+
+
+def bind_many(query: str, params_list: list[dict]) -> tuple[str, list[tuple]]:
+    """Translate a pyformat query and one params dict per row for executemany."""
+    sql, names = _compile_query(query)
+    return sql, [tuple(params[name] for name in names) for params in params_list]
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of open Snowflake connections.
+    
+    Opening a Snowflake session costs a login round-trip (hundreds of ms),
+    so connections are kept open and handed out again. Idle connections
+    beyond `size` are closed on release; closed ones are dropped.
+    """
+
+    def __init__(self, size: int):
+        """
+        Initialize the pool.
+        
+        Args:
+            size: Maximum number of idle connections kept open
+        """
+        self._idle: queue.LifoQueue[SnowflakeConnection] = queue.LifoQueue(maxsize=size)
+
+    def acquire(self) -> SnowflakeConnection:
+        """Return an idle connection, or open a new one if none is available."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if not conn.is_closed():
+                return conn
+
+    def release(self, conn: SnowflakeConnection) -> None:
+        """Return a connection to the pool, closing it if the pool is full."""
+        if conn.is_closed():
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    @staticmethod
+    def _connect() -> SnowflakeConnection:
+        start_time = time.perf_counter()
         
+        try:
+            conn = snowflake.connector.connect(**get_connection_params())
+        except Exception as e:
+            log_error(
+                message=f"Snowflake connection failed: {str(e)}",
+                error_type=type(e).__name__,
+            )
+            raise
+        
+        duration_ms = (time.perf_counter() - start_time) * 1000
         logger.debug(
             "Snowflake connection established",
             extra={
@@ -48,18 +154,105 @@ def get_connection() -> Generator[SnowflakeConnection, None, None]:
                 "duration_ms": round(duration_ms, 2),
             },
         )
+        return conn
+
+
+pool = ConnectionPool(size=settings.snowflake_pool_size)
+
+# Per-request holder {"conn": SnowflakeConnection | None}, set by
+# request_connection_scope; None outside a request
+_request_scope: ContextVar[dict | None] = ContextVar("_request_scope", default=None)
+
+
+async def request_connection_scope() -> AsyncGenerator[None, None]:
+    """
+    FastAPI dependency sharing one pooled connection across a request.
+    
+    The connection is checked out lazily on the first query, so requests
+    that never touch the database (or hit the caches) don't take one.
+    
+    Usage:
+        router = APIRouter(dependencies=[Depends(request_connection_scope)])
+    """
+    scope: dict = {"conn": None}
+    _request_scope.set(scope)
+    try:
+        yield
+    finally:
+        _request_scope.set(None)
+        if scope["conn"] is not None:
+            pool.release(scope["conn"])
+
+
+@contextmanager
+def get_connection() -> Generator[SnowflakeConnection, None, None]:
+    """
+    Context manager for pooled Snowflake connections.
+    
+    Inside a request scope every call yields the same connection, which
+    goes back to the pool when the request ends. Elsewhere each call
+    checks a connection out and returns it on exit.
+    
+    Usage:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+    """
+    scope = _request_scope.get()
+    if scope is not None:
+        if scope["conn"] is None:
+            scope["conn"] = pool.acquire()
+        yield scope["conn"]
+        return
+    
+    conn = pool.acquire()
+    try:
         yield conn
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def transaction(query_name: str = "unknown") -> Generator[Any, None, None]:
+    """
+    Context manager running several statements in one explicit transaction.
+    
+    Commits once when the block exits, rolls everything back on error.
+    
+    Usage:
+        with transaction("create_experiment") as cursor:
+            cursor.execute(*bind_params(query, params))
+            cursor.executemany(*bind_many(query, rows))
+    """
+    start_time = time.perf_counter()
+    
+    try:
+        with get_connection() as conn:
+            conn.autocommit(False)
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                # Pooled connections are shared: restore the default mode
+                conn.autocommit(True)
+        
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        log_db_query(query_name=query_name, duration_ms=duration_ms)
         
     except Exception as e:
+        duration_ms = (time.perf_counter() - start_time) * 1000
         log_error(
-            message=f"Snowflake connection failed: {str(e)}",
+            message=f"Transaction failed: {query_name}",
             error_type=type(e).__name__,
+            query_name=query_name,
+            duration_ms=round(duration_ms, 2),
         )
         raise
-        
-    finally:
-        if conn:
-            conn.close()
 
 
 @contextmanager
@@ -100,7 +293,7 @@ def execute_query(
     
     try:
         with get_cursor() as cursor:
-            cursor.execute(query, params or {})
+            cursor.execute(*bind_params(query, params))
             columns = [col[0].lower() for col in cursor.description]
             results = [dict(zip(columns, row)) for row in cursor.fetchall()]
             
@@ -124,13 +317,72 @@ def execute_query(
         raise
 
 
+def stream_query(
+    query: str,
+    params: dict | None = None,
+    query_name: str = "unknown",
+    batch_size: int = 1000,
+) -> Generator[dict, None, None]:
+    """
+    Execute a SELECT query and yield rows as dicts while they are fetched.
+    
+    Rows are pulled in batches of `batch_size`, so the full result set is
+    never held in memory. The connection comes straight from the pool and
+    is held for the generator's lifetime rather than the request scope, as
+    a streaming response outlives its handler; close the generator to
+    release it early.
+    
+    Args:
+        query: SQL query string
+        params: Query parameters
+        query_name: Name for logging purposes
+        batch_size: Rows fetched per round-trip
+        
+    Yields:
+        One dictionary per row with column names as keys
+    """
+    start_time = time.perf_counter()
+    rows_read = 0
+    conn = pool.acquire()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute(*bind_params(query, params))
+        columns = [col[0].lower() for col in cursor.description]
+        while batch := cursor.fetchmany(batch_size):
+            rows_read += len(batch)
+            for row in batch:
+                yield dict(zip(columns, row))
+                
+    except Exception as e:
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        log_error(
+            message=f"Query failed: {query_name}",
+            error_type=type(e).__name__,
+            query_name=query_name,
+            duration_ms=round(duration_ms, 2),
+        )
+        raise
+        
+    finally:
+        cursor.close()
+        pool.release(conn)
+    
+    duration_ms = (time.perf_counter() - start_time) * 1000
+    log_db_query(
+        query_name=query_name,
+        duration_ms=duration_ms,
+        rows_affected=rows_read,
+    )
+
+
 def execute_write(
     query: str,
     params: dict | None = None,
     query_name: str = "unknown",
 ) -> int:
     """
-    Execute an INSERT/UPDATE/DELETE query.
+    Execute a single INSERT/UPDATE/DELETE statement in autocommit mode.
     
     Args:
         query: SQL query string
@@ -146,8 +398,7 @@ def execute_write(
         with get_connection() as conn:
             cursor = conn.cursor()
             try:
-                cursor.execute(query, params or {})
-                conn.commit()
+                cursor.execute(*bind_params(query, params))
                 rows_affected = cursor.rowcount
                 
                 duration_ms = (time.perf_counter() - start_time) * 1000
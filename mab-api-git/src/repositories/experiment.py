@@ -1,12 +1,44 @@
 """Repository for experiment data access."""
 
-import uuid
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
 
-from src.repositories.database import execute_query, execute_write
+from src.cache import TTLCache
+from src.config import settings
+from src.repositories.database import (
+    bind_many,
+    bind_params,
+    execute_query,
+    execute_write,
+    transaction,
+)
+from src.repositories.ids import generate_ids
 from src.sql import ExperimentQueries, VariantQueries
 
+# Experiment and variant definitions are read on every metrics/allocation
+# request but only change on create or status update
+_experiment_cache = TTLCache(maxsize=1024, ttl=settings.experiment_cache_ttl)
+_variants_cache = TTLCache(maxsize=1024, ttl=settings.experiment_cache_ttl)
+# Names are unique and never change, so name -> id can't go stale; the
+# record itself still comes from _experiment_cache (invalidated on writes)
+_experiment_ids_by_name = TTLCache(maxsize=1024, ttl=settings.experiment_cache_ttl)
+
+
+def _utc_now() -> datetime:
+    """
+    Current UTC time as a naive datetime, matching the TIMESTAMP_NTZ columns.
+
+    The column defaults (CURRENT_TIMESTAMP()) follow the session timezone,
+    so inserts bind this value explicitly: the stored row and the API
+    response carry the same timestamp without reading the row back.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _copy_variants(variants: list[dict]) -> list[dict]:
+    """Copy cached variants so callers can't mutate shared state."""
+    return [dict(v) for v in variants]
+
 
 class ExperimentRepository:
     """Repository for experiment database operations."""
@@ -28,41 +60,47 @@ class ExperimentRepository:
         Returns:
             Created experiment dict with variants
         """
-        experiment_id = str(uuid.uuid4())
-        now = datetime.utcnow()
+        experiment_id, *variant_ids = generate_ids(1 + len(variants))
+        now = _utc_now()
         
-        # Insert experiment
-        execute_write(
-            ExperimentQueries.INSERT,
-            {
-                "id": experiment_id,
-                "name": name,
-                "description": description,
-                "status": "active",
-            },
-            query_name="insert_experiment",
-        )
-        
-        # Insert variants
-        created_variants = []
-        for variant in variants:
-            variant_id = str(uuid.uuid4())
-            execute_write(
-                VariantQueries.INSERT,
+        # Experiment and variants commit together: a failure half-way no
+        # longer leaves an experiment without variants
+        with transaction("create_experiment") as cursor:
+            cursor.execute(*bind_params(
+                ExperimentQueries.INSERT,
                 {
-                    "id": variant_id,
-                    "experiment_id": experiment_id,
-                    "name": variant["name"],
-                    "is_control": variant["is_control"],
+                    "id": experiment_id,
+                    "name": name,
+                    "description": description,
+                    "status": "active",
+                    "created_at": now,
                 },
-                query_name="insert_variant",
-            )
-            created_variants.append({
+            ))
+            cursor.executemany(*bind_many(
+                VariantQueries.INSERT,
+                [
+                    {
+                        "id": variant_id,
+                        "experiment_id": experiment_id,
+                        "name": variant["name"],
+                        "is_control": variant["is_control"],
+                        "created_at": now,
+                    }
+                    for variant, variant_id in zip(variants, variant_ids)
+                ],
+            ))
+
+        _experiment_ids_by_name.set(name, experiment_id)
+
+        created_variants = [
+            {
                 "id": variant_id,
                 "name": variant["name"],
                 "is_control": variant["is_control"],
                 "created_at": now,
-            })
+            }
+            for variant, variant_id in zip(variants, variant_ids)
+        ]
         
         return {
             "id": experiment_id,
@@ -76,36 +114,89 @@ class ExperimentRepository:
 
     @staticmethod
     def get_experiment_by_id(experiment_id: str) -> Optional[dict]:
-        """Get experiment by ID with its variants."""
-        result = execute_query(
-            ExperimentQueries.SELECT_BY_ID,
+        """
+        Get experiment by ID with its variants.
+        
+        Experiment and variants are read in one JOIN query. Results are
+        cached for `experiment_cache_ttl` seconds; misses (unknown IDs)
+        are not cached.
+        """
+        experiment = _experiment_cache.get(experiment_id)
+        if experiment is not None:
+            return {
+                **experiment,
+                "variants": VariantRepository.get_variants_by_experiment(experiment_id),
+            }
+        
+        rows = execute_query(
+            ExperimentQueries.SELECT_BY_ID_WITH_VARIANTS,
             {"id": experiment_id},
             query_name="get_experiment_by_id",
         )
-        if not result:
+        if not rows:
             return None
         
-        experiment = result[0]
-        
-        # Get variants
-        variants = execute_query(
-            VariantQueries.SELECT_BY_EXPERIMENT,
-            {"experiment_id": experiment_id},
-            query_name="get_variants_by_experiment",
-        )
+        first = rows[0]
+        experiment = {
+            "id": first["id"],
+            "name": first["name"],
+            "description": first["description"],
+            "status": first["status"],
+            "created_at": first["created_at"],
+            "updated_at": first["updated_at"],
+        }
+        variants = [
+            {
+                "id": row["variant_id"],
+                "experiment_id": experiment_id,
+                "name": row["variant_name"],
+                "is_control": row["variant_is_control"],
+                "created_at": row["variant_created_at"],
+            }
+            for row in rows
+            if row["variant_id"] is not None
+        ]
+        _experiment_cache.set(experiment_id, experiment)
+        _experiment_ids_by_name.set(experiment["name"], experiment_id)
+        _variants_cache.set(experiment_id, variants)
         
-        experiment["variants"] = variants
-        return experiment
+        return {**experiment, "variants": _copy_variants(variants)}
 
     @staticmethod
     def get_experiment_by_name(name: str) -> Optional[dict]:
-        """Get experiment by name."""
+        """
+        Get experiment by name.
+        
+        Served from the experiment cache when the name was seen recently;
+        misses are not cached since another worker may create the name.
+        """
+        experiment_id = _experiment_ids_by_name.get(name)
+        if experiment_id is not None:
+            experiment = _experiment_cache.get(experiment_id)
+            if experiment is not None:
+                return dict(experiment)
+        
         result = execute_query(
             ExperimentQueries.SELECT_BY_NAME,
             {"name": name},
             query_name="get_experiment_by_name",
         )
-        return result[0] if result else None
+        if not result:
+            return None
+        
+        experiment = result[0]
+        _experiment_cache.set(experiment["id"], experiment)
+        _experiment_ids_by_name.set(name, experiment["id"])
+        return dict(experiment)
+
+    @staticmethod
+    def get_active_experiment_ids() -> list[str]:
+        """Get IDs of all active experiments, oldest first."""
+        rows = execute_query(
+            ExperimentQueries.SELECT_ACTIVE_IDS,
+            query_name="get_active_experiment_ids",
+        )
+        return [row["id"] for row in rows]
 
     @staticmethod
     def update_status(experiment_id: str, status: str) -> bool:
@@ -117,11 +208,24 @@ class ExperimentRepository:
         """
         rows_affected = execute_write(
             ExperimentQueries.UPDATE_STATUS,
-            {"id": experiment_id, "status": status},
+            {"id": experiment_id, "status": status, "updated_at": _utc_now()},
             query_name="update_experiment_status",
         )
+        _experiment_cache.pop(experiment_id)
         return rows_affected > 0
 
+    @staticmethod
+    def invalidate_cache(experiment_id: str) -> None:
+        """
+        Drop the cached experiment after a write made elsewhere.
+        
+        Metrics writes bump updated_at in their own transaction (see
+        `MetricsRepository.insert_metrics_bulk`); this makes the next read
+        in this process see it. Other processes keep their cached copy for
+        up to `experiment_cache_ttl` seconds.
+        """
+        _experiment_cache.pop(experiment_id)
+
 
 class VariantRepository:
     """Repository for variant database operations."""
@@ -131,18 +235,23 @@ class VariantRepository:
         """Insert a new variant."""
         execute_write(
             VariantQueries.INSERT,
-            variant_data,
+            {"created_at": _utc_now(), **variant_data},
             query_name="insert_variant",
         )
+        _variants_cache.pop(variant_data["experiment_id"])
 
     @staticmethod
     def get_variants_by_experiment(experiment_id: str) -> list[dict]:
-        """Get all variants for an experiment."""
-        return execute_query(
-            VariantQueries.SELECT_BY_EXPERIMENT,
-            {"experiment_id": experiment_id},
-            query_name="get_variants_by_experiment",
-        )
+        """Get all variants for an experiment (cached like experiments)."""
+        variants = _variants_cache.get(experiment_id)
+        if variants is None:
+            variants = execute_query(
+                VariantQueries.SELECT_BY_EXPERIMENT,
+                {"experiment_id": experiment_id},
+                query_name="get_variants_by_experiment",
+            )
+            _variants_cache.set(experiment_id, variants)
+        return _copy_variants(variants)
 
     @staticmethod
     def get_variant_by_name_and_experiment(
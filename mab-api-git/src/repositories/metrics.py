@@ -1,87 +1,174 @@
 """Repository for metrics operations."""
 
-import uuid
+import csv
+import io
+import time
 from datetime import date
 from decimal import Decimal
+from itertools import chain
+from typing import Iterator, Optional
 
-from src.repositories.database import execute_query, get_connection
-from src.sql import MetricsQueries
+from src.repositories.database import (
+    bind_params,
+    execute_query,
+    get_connection,
+    stream_query,
+    transaction,
+)
+from src.repositories.experiment import _utc_now
+from src.sql import ExperimentQueries, MetricsQueries
 from src.config import settings
+from src.logging_config import log_db_query
+
+_ROW_DEFAULTS = {
+    "sessions": 0,
+    "revenue": Decimal("0"),
+    "source": "api",
+    "batch_id": None,
+}
+
+# Padding row for bulk VALUES lists; filtered out by the statement
+_NULL_ROW = dict.fromkeys((
+    "variant_id", "metric_date", "sessions", "impressions",
+    "clicks", "revenue", "source", "batch_id",
+))
 
 
 class MetricsRepository:
     """Repository for metrics CRUD operations."""
 
     @staticmethod
-    def insert_metrics(
-        variant_id: str,
-        metric_date: date,
-        impressions: int,
-        clicks: int,
-        sessions: int = 0,
-        revenue: Decimal = Decimal("0"),
-        source: str = "api",
-        batch_id: str | None = None,
-    ) -> None:
+    def insert_metrics_bulk(experiment_id: str, rows: list[dict]) -> None:
+        """
+        Insert a batch of metrics into raw and daily tables in one request.
+        
+        Every row is appended to raw_metrics. For daily_metrics, rows sharing
+        (variant_id, metric_date) collapse to the last one, matching what
+        sequential upserts would leave behind. The experiment's updated_at
+        is bumped in the same transaction, so the ETags change exactly when
+        the metrics are stored.
+        
+        Args:
+            experiment_id: UUID of the experiment the variants belong to
+            rows: Dicts with variant_id, metric_date, impressions and
+                clicks; sessions (default 0), revenue (default 0), source
+                (default "api") and batch_id (default None) are optional
+        """
+        if not rows:
+            return
+
+        rows = [{**_ROW_DEFAULTS, **row} for row in rows]
+        daily_rows = list({(r["variant_id"], r["metric_date"]): r for r in rows}.values())
+
+        # Both lists are padded with NULL rows to a fixed size, so the
+        # number of distinct statement texts (and plans) stays small
+        size = MetricsQueries.bulk_batch_size(len(rows))
+        rows += [_NULL_ROW] * (size - len(rows))
+        daily_rows += [_NULL_ROW] * (size - len(daily_rows))
+
+        params = {"id": experiment_id, "updated_at": _utc_now()}
+        for i, row in enumerate(rows):
+            params.update({
+                f"raw_variant_id_{i}": row["variant_id"],
+                f"raw_metric_date_{i}": row["metric_date"],
+                f"raw_sessions_{i}": row["sessions"],
+                f"raw_impressions_{i}": row["impressions"],
+                f"raw_clicks_{i}": row["clicks"],
+                f"raw_revenue_{i}": row["revenue"],
+                f"raw_source_{i}": row["source"],
+                f"raw_batch_id_{i}": row["batch_id"],
+            })
+        for i, row in enumerate(daily_rows):
+            params.update({
+                f"daily_variant_id_{i}": row["variant_id"],
+                f"daily_metric_date_{i}": row["metric_date"],
+                f"daily_sessions_{i}": row["sessions"],
+                f"daily_impressions_{i}": row["impressions"],
+                f"daily_clicks_{i}": row["clicks"],
+                f"daily_revenue_{i}": row["revenue"],
+            })
+
+        query = MetricsQueries.insert_raw_and_upsert_daily_bulk(size)
+        with transaction("insert_metrics_bulk") as cursor:
+            cursor.execute(*bind_params(query, params), num_statements=3)
+
+    @staticmethod
+    def bulk_copy_metrics(experiment_id: str, rows: list[dict]) -> None:
         """
-        Insert metrics into both raw and daily tables.
+        Load a large batch of metrics through a stage and COPY INTO.
         
-        Raw table: append-only for audit
-        Daily table: upsert for clean data
+        Past a few thousand rows, generated VALUES lists get slow to send
+        and compile. Here the rows travel as one compressed CSV file (PUT)
+        into a session temp table (COPY INTO), then raw_metrics and
+        daily_metrics are written from it in one transaction with the same
+        semantics as `insert_metrics_bulk` (including the updated_at bump).
         
         Args:
-            variant_id: Variant UUID
-            metric_date: Date of the metrics
-            impressions: Number of impressions
-            clicks: Number of clicks
-            sessions: Number of unique sessions
-            revenue: Revenue in USD
-            source: Origin of the data (api, gam, cdp, manual)
-            batch_id: Batch ID for traceability
+            experiment_id: UUID of the experiment the variants belong to
+            rows: Dicts with variant_id, metric_date, impressions and
+                clicks; sessions (default 0), revenue (default 0), source
+                (default "api") and batch_id (default None) are optional
         """
-        raw_id = str(uuid.uuid4())
-        daily_id = str(uuid.uuid4())
+        if not rows:
+            return
+
+        start_time = time.perf_counter()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for seq, row in enumerate(rows):
+            row = {**_ROW_DEFAULTS, **row}
+            writer.writerow((
+                seq,
+                row["variant_id"],
+                row["metric_date"].isoformat(),
+                row["sessions"],
+                row["impressions"],
+                row["clicks"],
+                row["revenue"],
+                row["source"],
+                row["batch_id"] or "",
+            ))
+        file_stream = io.BytesIO(buffer.getvalue().encode())
 
+        # The temp table lives in the session, so every statement must run
+        # on the same connection; DDL commits implicitly, so only the final
+        # writes are wrapped in an explicit transaction
         with get_connection() as conn:
             cursor = conn.cursor()
             try:
-                # Insert into raw_metrics (append-only)
+                cursor.execute(*bind_params(MetricsQueries.CREATE_STAGE_TABLE))
                 cursor.execute(
-                    MetricsQueries.INSERT_RAW,
-                    {
-                        "id": raw_id,
-                        "variant_id": variant_id,
-                        "metric_date": metric_date,
-                        "sessions": sessions,
-                        "impressions": impressions,
-                        "clicks": clicks,
-                        "revenue": float(revenue),
-                        "source": source,
-                        "batch_id": batch_id,
-                    },
+                    *bind_params(MetricsQueries.PUT_STAGE_FILE),
+                    file_stream=file_stream,
                 )
+                cursor.execute(*bind_params(MetricsQueries.COPY_STAGE_FILE))
 
-                # Upsert into daily_metrics
-                cursor.execute(
-                    MetricsQueries.UPSERT_DAILY,
-                    {
-                        "id": daily_id,
-                        "variant_id": variant_id,
-                        "metric_date": metric_date,
-                        "sessions": sessions,
-                        "impressions": impressions,
-                        "clicks": clicks,
-                        "revenue": float(revenue),
-                    },
-                )
+                conn.autocommit(False)
+                try:
+                    cursor.execute(*bind_params(MetricsQueries.INSERT_RAW_FROM_STAGE))
+                    cursor.execute(*bind_params(MetricsQueries.UPSERT_DAILY_FROM_STAGE))
+                    cursor.execute(*bind_params(
+                        ExperimentQueries.TOUCH,
+                        {"id": experiment_id, "updated_at": _utc_now()},
+                    ))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    conn.autocommit(True)
 
-                conn.commit()
-            except Exception as e:
-                conn.rollback()
-                raise e
+                cursor.execute(*bind_params(MetricsQueries.DROP_STAGE_TABLE))
             finally:
                 cursor.close()
 
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        log_db_query(
+            query_name="bulk_copy_metrics",
+            duration_ms=duration_ms,
+            rows_affected=len(rows),
+        )
+
     @staticmethod
     def get_metrics_for_allocation(
         experiment_id: str,
@@ -112,18 +199,130 @@ class MetricsRepository:
         )
 
     @staticmethod
-    def get_metrics_history(experiment_id: str) -> list[dict]:
+    def get_metrics_multi_window(
+        experiment_id: str,
+        windows: list[int],
+    ) -> dict[int, list[dict]]:
+        """
+        Get aggregated allocation metrics for several windows in one query.
+
+        Args:
+            experiment_id: Experiment UUID
+            windows: Window sizes in days
+
+        Returns:
+            Dict of window -> list of variant metric dicts (same shape as
+            `get_metrics_for_allocation`)
+        """
+        windows = list(dict.fromkeys(windows))
+        if not windows:
+            return {}
+
+        params = {f"window_days_{i}": window for i, window in enumerate(windows)}
+        params.update({
+            "experiment_id": experiment_id,
+            "window_days": max(windows),
+            "prior_alpha": settings.prior_alpha,
+            "prior_beta": settings.prior_beta,
+        })
+        rows = execute_query(
+            MetricsQueries.select_for_allocation_windows(len(windows)),
+            params,
+            query_name="get_metrics_multi_window",
+        )
+
+        columns = ("impressions", "clicks", "ctr", "beta_alpha", "beta_beta")
+        return {
+            window: [
+                {
+                    "variant_id": row["variant_id"],
+                    "variant_name": row["variant_name"],
+                    "is_control": row["is_control"],
+                    **{column: row[f"{column}_{i}"] for column in columns},
+                }
+                for row in rows
+            ]
+            for i, window in enumerate(windows)
+        }
+
+    @staticmethod
+    def get_metrics_for_allocation_many(
+        experiment_ids: list[str],
+        window_days: int | None = None,
+    ) -> dict[str, list[dict]]:
         """
-        Get historical metrics for an experiment.
+        Get aggregated allocation metrics for several experiments in one query.
+        
+        Args:
+            experiment_ids: Experiment UUIDs
+            window_days: Number of days to look back (default from settings)
+            
+        Returns:
+            Dict of experiment ID -> list of variant metric dicts (same
+            shape as `get_metrics_for_allocation`)
+        """
+        if not experiment_ids:
+            return {}
+        if window_days is None:
+            window_days = settings.default_window_days
+
+        experiment_ids = list(dict.fromkeys(experiment_ids))
+        params = {f"experiment_id_{i}": eid for i, eid in enumerate(experiment_ids)}
+        params.update({
+            "window_days": window_days,
+            "prior_alpha": settings.prior_alpha,
+            "prior_beta": settings.prior_beta,
+        })
+        rows = execute_query(
+            MetricsQueries.select_for_allocation_many(len(experiment_ids)),
+            params,
+            query_name="get_metrics_for_allocation_many",
+        )
+
+        result = {eid: [] for eid in experiment_ids}
+        for row in rows:
+            result[row.pop("experiment_id")].append(row)
+        return result
+
+    @staticmethod
+    def stream_experiment_history(
+        experiment_id: str,
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> Optional[tuple[str, Iterator[dict]]]:
+        """
+        Get an experiment's name and a lazy iterator over its metrics history.
+        
+        Existence and history come from one query; only its first row is
+        read here, the rest is fetched as the iterator is consumed.
         
         Args:
             experiment_id: Experiment UUID
+            start_date: First metric date to include (default: unbounded)
+            end_date: Last metric date to include (default: unbounded)
             
         Returns:
-            List of daily metrics per variant
+            Tuple of (experiment name, iterator of daily metrics per
+            variant), or None if the experiment doesn't exist
         """
-        return execute_query(
-            MetricsQueries.SELECT_HISTORY,
-            {"experiment_id": experiment_id},
-            query_name="get_metrics_history",
+        rows = stream_query(
+            MetricsQueries.SELECT_EXPERIMENT_HISTORY,
+            {
+                "experiment_id": experiment_id,
+                "start_date": start_date,
+                "end_date": end_date,
+            },
+            query_name="get_experiment_history",
         )
+        first = next(rows, None)
+        if first is None:
+            return None
+        
+        def history() -> Iterator[dict]:
+            for row in chain((first,), rows):
+                del row["experiment_name"]
+                # No-history experiments come back as one row of NULLs
+                if row["variant_id"] is not None:
+                    yield row
+        
+        return first["experiment_name"], history()
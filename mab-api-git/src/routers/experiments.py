@@ -1,18 +1,32 @@
 """Experiment endpoints."""
 
+import hashlib
+from datetime import date
 from enum import Enum
-from fastapi import APIRouter, HTTPException, Query
+from typing import Iterator
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from src.models.experiment import ExperimentCreate, ExperimentResponse
 from src.models.metrics import MetricsBatchRequest, MetricsResponse
-from src.models.allocation import AllocationResponse
+from src.models.allocation import AllocationResponse, BatchAllocationResponse
 from src.services.experiment import ExperimentService
-from src.services.allocation import AllocationService
+from src.services.allocation import allocation_service
 from src.config import settings
 from src.rate_limit import check_daily_allocation_limit
+from src.repositories.database import request_connection_scope
+from src.serialization import dumps
 
-router = APIRouter(prefix="/experiments", tags=["Experiments"])
+# Handlers are plain `def`: the Snowflake connector is blocking, so FastAPI
+# runs them in its threadpool instead of stalling the event loop.
+# All repository calls within one request share a single pooled connection
+router = APIRouter(
+    prefix="/experiments",
+    tags=["Experiments"],
+    dependencies=[Depends(request_connection_scope)],
+)
 
 
 class ExperimentStatus(str, Enum):
@@ -34,7 +48,7 @@ class StatusUpdate(BaseModel):
     summary="Create Experiment",
     description="Create a new A/B test experiment with variants",
 )
-async def create_experiment(data: ExperimentCreate):
+def create_experiment(data: ExperimentCreate):
     """
     Create a new experiment with its variants.
     
@@ -48,27 +62,117 @@ async def create_experiment(data: ExperimentCreate):
         raise HTTPException(status_code=409, detail=str(e))
 
 
+@router.get(
+    "/allocations",
+    response_model=BatchAllocationResponse,
+    summary="Get Allocations (batch)",
+    description="Get optimized traffic allocations for several experiments at once",
+)
+def get_allocations(
+    experiment_ids: list[str] = Query(
+        ...,
+        min_length=1,
+        max_length=50,
+        description="Experiment IDs (repeat the parameter for each one)",
+    ),
+    window_days: int = Query(
+        default=None,
+        ge=1,
+        le=90,
+        description=f"Number of days to analyze (default: {settings.default_window_days})",
+    ),
+):
+    """
+    Calculate allocations for several experiments (e.g. a dashboard).
+    
+    Same algorithm as `GET /experiments/{experiment_id}/allocation`, but
+    metrics for all experiments are read in a single query per window.
+    
+    Note: All experiments must exist and have status 'active'.
+    
+    Rate Limits:
+    - 60 requests per minute (burst protection)
+    - Each experiment counts towards the daily allocation limit
+    """
+    experiment_ids = list(dict.fromkeys(experiment_ids))
+    
+    # Check daily limit first (cost protection)
+    check_daily_allocation_limit(cost=len(experiment_ids))
+    
+    # Check experiment status
+    for experiment_id in experiment_ids:
+        experiment = ExperimentService.get_experiment(experiment_id)
+        if not experiment:
+            raise HTTPException(
+                status_code=404, detail=f"Experiment '{experiment_id}' not found"
+            )
+        if experiment.status != "active":
+            raise HTTPException(
+                status_code=400,
+                detail=f"Experiment '{experiment_id}' is '{experiment.status}'. Only 'active' experiments can calculate allocation."
+            )
+    
+    return BatchAllocationResponse(
+        experiments=allocation_service.get_allocations(experiment_ids, window_days)
+    )
+
+
 @router.get(
     "/{experiment_id}",
     response_model=ExperimentResponse,
     summary="Get Experiment",
     description="Get experiment details by ID",
 )
-async def get_experiment(experiment_id: str):
-    """Get experiment details including all variants."""
+def get_experiment(experiment_id: str, request: Request, response: Response):
+    """
+    Get experiment details including all variants.
+    
+    Responses carry an ETag; send it back in If-None-Match to get a 304
+    while the experiment hasn't changed.
+    """
     result = ExperimentService.get_experiment(experiment_id)
     if not result:
         raise HTTPException(status_code=404, detail="Experiment not found")
+    
+    etag = _experiment_etag(result, "experiment")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
     return result
 
 
+def _experiment_etag(experiment: ExperimentResponse, resource: str) -> str:
+    """
+    ETag for a resource derived from an experiment.
+    
+    Status updates and recorded metrics both bump updated_at, so it
+    changes whenever the experiment or its history does. The experiment
+    comes from the per-process cache, which is only invalidated in the
+    process that handled the write: other workers can keep answering 304
+    for up to `experiment_cache_ttl` seconds after a change.
+    """
+    key = f"{resource}:{experiment.id}:{experiment.updated_at}:{len(experiment.variants)}"
+    return f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Whether If-None-Match lists `etag` (weak comparison) or is `*`."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
+
+
 @router.patch(
     "/{experiment_id}/status",
     response_model=ExperimentResponse,
     summary="Update Experiment Status",
     description="Update experiment status (active, paused, completed)",
 )
-async def update_status(experiment_id: str, data: StatusUpdate):
+def update_status(experiment_id: str, data: StatusUpdate):
     """
     Update experiment status.
     
@@ -92,7 +196,7 @@ async def update_status(experiment_id: str, data: StatusUpdate):
     summary="Record Metrics",
     description="Record daily metrics for experiment variants",
 )
-async def record_metrics(experiment_id: str, data: MetricsBatchRequest):
+def record_metrics(experiment_id: str, data: MetricsBatchRequest):
     """
     Record metrics (impressions and clicks) for each variant.
     
@@ -116,8 +220,10 @@ async def record_metrics(experiment_id: str, data: MetricsBatchRequest):
     summary="Get Allocation",
     description="Get optimized traffic allocation for the next day",
 )
-async def get_allocation(
+def get_allocation(
     experiment_id: str,
+    request: Request,
+    response: Response,
     window_days: int = Query(
         default=None,
         ge=1,
@@ -141,6 +247,9 @@ async def get_allocation(
     Rate Limits:
     - 300 requests per minute (burst protection)
     - 3000 requests per day (cost protection)
+    
+    Responses carry an ETag; send it back in If-None-Match to get a 304
+    while the allocation hasn't been recomputed.
     """
     # Check daily limit first (cost protection)
     check_daily_allocation_limit()
@@ -156,45 +265,100 @@ async def get_allocation(
             detail=f"Experiment is '{experiment.status}'. Only 'active' experiments can calculate allocation."
         )
     
-    service = AllocationService()
-    result = service.get_allocation(experiment_id, window_days)
+    result = allocation_service.get_allocation(experiment_id, window_days)
     if not result:
         raise HTTPException(status_code=404, detail="Experiment not found")
     
+    etag = _allocation_etag(result)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
     return result
 
 
+def _allocation_etag(result: AllocationResponse) -> str:
+    """ETag for an allocation; changes whenever it is recomputed."""
+    # computed_at is naive UTC: isoformat, unlike timestamp(), doesn't
+    # depend on the server's local timezone
+    return f'"{result.experiment_id}:{result.window_days}:{result.computed_at.isoformat()}"'
+
+
 @router.get(
     "/{experiment_id}/history",
     summary="Get Metrics History",
     description="Get historical metrics for an experiment",
 )
-async def get_history(experiment_id: str):
+def get_history(
+    experiment_id: str,
+    request: Request,
+    start_date: date | None = Query(
+        default=None,
+        description="First metric date to include (default: no lower bound)",
+    ),
+    end_date: date | None = Query(
+        default=None,
+        description="Last metric date to include (default: no upper bound)",
+    ),
+):
     """
     Get daily metrics history for all variants.
     
     Returns time series data useful for visualization and debugging.
+    Rows are serialized and streamed as they are fetched. At most 90 rows
+    (most recent first) are returned; use start_date/end_date to read
+    other periods.
+    
+    Responses carry an ETag; a matching If-None-Match returns 304 without
+    running the history query.
     """
     from src.repositories.metrics import MetricsRepository
-    from src.repositories.experiment import ExperimentRepository
-    from src.services.allocation import wilson_score_interval
 
-    # Verify experiment exists
-    experiment = ExperimentRepository.get_experiment_by_id(experiment_id)
+    # The experiment lookup is cached, so revalidation is cheap
+    experiment = ExperimentService.get_experiment(experiment_id)
     if not experiment:
         raise HTTPException(status_code=404, detail="Experiment not found")
-
-    history = MetricsRepository.get_metrics_history(experiment_id)
     
-    # Add CTR confidence interval to each record
+    etag = _experiment_etag(experiment, f"history:{start_date}:{end_date}")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    result = MetricsRepository.stream_experiment_history(
+        experiment_id, start_date=start_date, end_date=end_date
+    )
+    if result is None:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+
+    experiment_name, history = result
+    return StreamingResponse(
+        _history_json(experiment_id, experiment_name, history),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def _history_json(
+    experiment_id: str,
+    experiment_name: str,
+    history: Iterator[dict],
+) -> Iterator[bytes]:
+    """Encode the history payload one record at a time."""
+    from src.services.allocation import wilson_score_interval
+
+    yield (
+        b'{"experiment_id":' + dumps(experiment_id)
+        + b',"experiment_name":' + dumps(experiment_name)
+        + b',"history":['
+    )
+    separator = b""
     for record in history:
+        # Add CTR confidence interval to each record
         impressions = int(record.get("impressions", 0))
         clicks = int(record.get("clicks", 0))
         ci = wilson_score_interval(clicks, impressions)
         record["ctr_ci"] = {"lower": ci.lower, "upper": ci.upper} if ci else None
-    
-    return {
-        "experiment_id": experiment_id,
-        "experiment_name": experiment["name"],
-        "history": history,
-    }
+        yield separator + dumps(record)
+        separator = b","
+    yield b"]}"
@@ -2,6 +2,8 @@
 
 from fastapi import APIRouter
 
+from src.serialization import OrjsonResponse
+
 router = APIRouter(tags=["Health"])
 
 
@@ -9,6 +11,7 @@ router = APIRouter(tags=["Health"])
     "/health",
     summary="Health Check",
     description="Check if the API is running",
+    response_class=OrjsonResponse,
 )
 async def health_check():
     """Return health status of the API."""
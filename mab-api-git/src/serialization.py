@@ -0,0 +1,38 @@
+"""JSON serialization helpers backed by orjson."""
+
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _default(value: Any) -> Any:
+    """Serialize types orjson doesn't handle natively."""
+    # Snowflake returns NUMBER columns with a scale (e.g. CTR) as Decimal
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Serialize a value to JSON bytes.
+
+    Handles datetime, date, UUID, dataclasses and numpy arrays natively,
+    plus Decimal (as float).
+    """
+    return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+class OrjsonResponse(JSONResponse):
+    """
+    JSONResponse rendered with `dumps`.
+
+    For routes returning plain dicts. Routes with a `response_model` should
+    keep FastAPI's default class, which serializes through Pydantic's own
+    JSON encoder; any custom response class turns that fast path off.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
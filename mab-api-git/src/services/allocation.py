@@ -1,15 +1,20 @@
 """Thompson Sampling implementation for Multi-Armed Bandit."""
 
+import asyncio
 import hashlib
+import logging
 import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, date
+from itertools import repeat
 import time
 from typing import Optional
 
 import numpy as np
-from scipy import stats
 
+from src.cache import TTLCache
 from src.config import settings
 from src.repositories.experiment import ExperimentRepository
 from src.repositories.metrics import MetricsRepository
@@ -20,13 +25,145 @@ from src.models.allocation import (
     VariantAllocation,
     VariantMetrics,
 )
-from src.logging_config import log_algorithm
+from src.logging_config import log_algorithm, log_error, logger
 
 # Algorithm version - increment when logic changes
-ALGORITHM_VERSION = "1.0.0"
+ALGORITHM_VERSION = "1.10.0"
 
 # Z-score for 95% confidence interval
 Z_95 = 1.96
+Z_95_SQUARED = Z_95 * Z_95
+
+# Z-score for the 99.99% credible interval used to detect a dominant arm
+Z_9999 = 3.89
+
+# Above this many series terms (alpha of the smaller arm), the exact
+# two-arm probability costs more than sampling and Monte Carlo is used
+EXACT_TWO_ARM_MAX_TERMS = 100_000
+
+# Beta(α, β) is sampled as a normal with the same mean and variance once
+# both α and β are at least this (skewness ≈ 2/√min(α, β) ≤ 0.2). Skew
+# depends on the smaller parameter, not α + β: at 1% CTR, Beta(11, 1090)
+# is still visibly skewed. Applied to every variant or none, so arms are
+# never compared across sampling methods
+NORMAL_APPROX_MIN_PARAM = 100
+
+# Monte Carlo rows drawn and reduced at a time, so memory stays bounded
+# (block * n_variants floats) however large thompson_samples is set
+SAMPLE_BLOCK_ROWS = 65_536
+
+# Monte Carlo runs in doubling stages from EARLY_STOP_MIN_ROWS and stops
+# once the leading variant's win rate is known to ±EARLY_STOP_HALF_WIDTH
+# (0.5 percentage point); only near-unanimous leaders stop before n_samples
+EARLY_STOP_MIN_ROWS = 1000
+EARLY_STOP_HALF_WIDTH = 0.005
+
+# Experiments per metrics query in the background refresh, matching the
+# batch endpoint's limit so the IN list stays bounded
+REFRESH_BATCH_SIZE = 50
+
+# Threads running Monte Carlo blocks in parallel (numpy releases the GIL
+# while filling sample arrays); None runs blocks inline
+_sampling_pool = (
+    ThreadPoolExecutor(max_workers=settings.thompson_workers, thread_name_prefix="thompson")
+    if settings.thompson_workers > 1
+    else None
+)
+
+# experiment_id -> {(window_days, date): (AllocationResponse, pending
+# history record or None)}. Inputs only change when metrics are recorded
+# (which invalidates) or the day rolls over (part of the key), and the seed
+# is fixed per day, so a cached result is identical to a recomputed one
+_allocation_cache = TTLCache(maxsize=1024, ttl=settings.allocation_cache_ttl)
+# Serializes read-modify-write of the per-experiment dicts above; handlers
+# run in a threadpool, and a pending history record must be taken once
+_allocation_cache_lock = threading.Lock()
+
+
+# (n_samples, seed, per-variant inputs) -> percentages. Unlike the
+# response cache above this survives new metrics: data outside the window
+# (e.g. today's) invalidates the response but leaves the posteriors, and
+# therefore the result, unchanged. The seed changes daily, so entries are
+# useless after a day
+_allocation_memo = TTLCache(maxsize=1024, ttl=24 * 60 * 60)
+
+
+def invalidate_allocation_cache(experiment_id: str) -> None:
+    """Drop cached allocations for an experiment (call after new metrics)."""
+    _allocation_cache.pop(experiment_id)
+
+
+def _get_cached_allocation(
+    experiment_id: str, window_days: int, day: date, save_history: bool
+) -> Optional[AllocationResponse]:
+    with _allocation_cache_lock:
+        entries = _allocation_cache.get(experiment_id) or {}
+        entry = entries.get((window_days, day))
+        if entry is None:
+            return None
+        result, pending = entry
+        # A result computed without saving (background refresh) is recorded
+        # the first time it is served to a caller that wants history
+        if save_history and pending is not None:
+            entries[(window_days, day)] = (result, None)
+        else:
+            pending = None
+    if pending is not None:
+        _save_history(experiment_id, pending)
+    return result
+
+
+def _cache_allocation(
+    experiment_id: str,
+    window_days: int,
+    day: date,
+    result: AllocationResponse,
+    pending: Optional[dict],
+) -> AllocationResponse:
+    """
+    Cache a computed allocation and return the one to serve.
+    
+    A recomputation equal to the cached result (background refresh with
+    unchanged inputs) keeps the cached entry, so its computed_at, ETag
+    and history state don't churn.
+    """
+    with _allocation_cache_lock:
+        # Re-set on every write so each refresh extends the expiry; entries
+        # from previous days are dropped on the way
+        entries = {
+            key: entry
+            for key, entry in (_allocation_cache.get(experiment_id) or {}).items()
+            if key[1] == day
+        }
+        current = entries.get((window_days, day))
+        if current is not None and _same_allocation(current[0], result):
+            # An already saved recomputation covers a pending record
+            result, pending = current[0], current[1] if pending is not None else None
+        entries[(window_days, day)] = (result, pending)
+        _allocation_cache.set(experiment_id, entries)
+    return result
+
+
+def _same_allocation(a: AllocationResponse, b: AllocationResponse) -> bool:
+    """Whether two results differ only in computed_at."""
+    return (
+        a.window_days == b.window_days
+        and a.algorithm == b.algorithm
+        and a.allocations == b.allocations
+    )
+
+
+def _save_history(experiment_id: str, record: dict) -> None:
+    """Write an allocation_history row; failures are logged, not raised."""
+    try:
+        AllocationHistoryRepository.save_allocation(experiment_id=experiment_id, **record)
+    except Exception as e:
+        # Log but don't fail the request if history save fails
+        log_error(
+            message=f"Failed to save allocation history: {e}",
+            error_type="allocation_history_save",
+            experiment_id=experiment_id,
+        )
 
 
 def wilson_score_interval(clicks: int, impressions: int) -> Optional[ConfidenceInterval]:
@@ -55,7 +192,7 @@ def wilson_score_interval(clicks: int, impressions: int) -> Optional[ConfidenceI
     n = impressions
     p = clicks / n
     z = Z_95
-    z2 = z * z
+    z2 = Z_95_SQUARED
     
     denominator = 1 + z2 / n
     center = (p + z2 / (2 * n)) / denominator
@@ -70,7 +207,80 @@ def wilson_score_interval(clicks: int, impressions: int) -> Optional[ConfidenceI
     )
 
 
-@dataclass
+def wilson_score_intervals(
+    clicks: np.ndarray, impressions: np.ndarray
+) -> list[Optional[ConfidenceInterval]]:
+    """
+    Vectorized `wilson_score_interval` over aligned per-variant arrays.
+    
+    Same formula and results, computed with one set of array operations
+    instead of one scalar call per variant.
+    
+    Args:
+        clicks: Successes per variant
+        impressions: Trials per variant
+        
+    Returns:
+        ConfidenceInterval (or None where impressions is 0) per variant
+    """
+    n = impressions.astype(float)
+    z = Z_95
+    z2 = Z_95_SQUARED
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = clicks / n
+        denominator = 1 + z2 / n
+        center = (p + z2 / (2 * n)) / denominator
+        margin = (z / denominator) * np.sqrt((p * (1 - p) / n) + (z2 / (4 * n * n)))
+    
+    lower = np.maximum(0.0, center - margin).tolist()
+    upper = np.minimum(1.0, center + margin).tolist()
+    
+    # Python round, not np.round, so bounds match the scalar version exactly
+    return [
+        ConfidenceInterval(lower=round(lo, 6), upper=round(hi, 6)) if trials else None
+        for lo, hi, trials in zip(lower, upper, impressions.tolist())
+    ]
+
+
+def _log_beta(a: float, b: float) -> float:
+    """Natural log of the Beta function B(a, b)."""
+    return math.lgamma(a) + math.lgamma(b) - math.lgamma(a + b)
+
+
+def probability_b_beats_a(
+    alpha_a: float, beta_a: float, alpha_b: float, beta_b: float
+) -> float:
+    """
+    Exact P(θ_B > θ_A) for θ_A ~ Beta(alpha_a, beta_a), θ_B ~ Beta(alpha_b, beta_b).
+    
+    Closed form for integer alpha_b (Evan Miller, "Formulas for Bayesian
+    A/B Testing"):
+        Σ_{i=0}^{alpha_b-1} B(alpha_a+i, beta_a+beta_b) / ((beta_b+i) B(1+i, beta_b) B(alpha_a, beta_a))
+    
+    Consecutive terms differ by the factor
+    (alpha_a+i)(beta_b+i) / ((alpha_a+beta_a+beta_b+i)(i+1)), so the series
+    is built with one cumulative sum in log space (no overflow) instead of
+    alpha_b Beta function evaluations.
+    
+    Args:
+        alpha_a, beta_a: Posterior parameters of arm A
+        alpha_b, beta_b: Posterior parameters of arm B (alpha_b integer-valued)
+        
+    Returns:
+        Probability that arm B has the higher CTR
+    """
+    i = np.arange(alpha_b - 1, dtype=float)
+    log_ratios = (
+        np.log(alpha_a + i) + np.log(beta_b + i)
+        - np.log(alpha_a + beta_a + beta_b + i) - np.log1p(i)
+    )
+    log_first = _log_beta(alpha_a, beta_a + beta_b) - _log_beta(alpha_a, beta_a)
+    log_terms = log_first + np.concatenate(([0.0], np.cumsum(log_ratios)))
+    return min(1.0, float(np.exp(log_terms).sum()))
+
+
+@dataclass(slots=True)
 class VariantData:
     """Internal representation of variant data for Thompson Sampling."""
     
@@ -136,6 +346,9 @@ class ThompsonSamplingEngine:
         self.n_samples = n_samples or settings.thompson_samples
         self.prior_alpha = prior_alpha or settings.prior_alpha
         self.prior_beta = prior_beta or settings.prior_beta
+        # Unseeded calls share one generator instead of seeding a new one
+        # from OS entropy each time (numpy serializes access internally)
+        self._rng = np.random.default_rng()
 
     def calculate_allocation(
         self,
@@ -150,6 +363,12 @@ class ThompsonSamplingEngine:
         2. The variant with highest θ "wins"
         3. Allocation = proportion of wins for each variant
         
+        With exactly two variants the win probability is computed in
+        closed form instead (see `probability_b_beats_a`).
+        
+        Extracts the variants' fields into arrays once and delegates to
+        `allocate`, which never touches the VariantData objects.
+        
         Args:
             variants: List of variant data with beta parameters
             seed: Random seed for reproducibility (optional)
@@ -160,52 +379,285 @@ class ThompsonSamplingEngine:
         if not variants:
             return {}
 
-        # Set seed for reproducibility
-        if seed is not None:
-            np.random.seed(seed)
-
-        # Handle case with no data - return uniform allocation
-        total_impressions = sum(v.impressions for v in variants)
-        if total_impressions == 0:
-            uniform_pct = round(100.0 / len(variants), 2)
-            return {v.variant_name: uniform_pct for v in variants}
-
-        # Sample from Beta distribution for each variant
-        samples = {
-            v.variant_name: stats.beta.rvs(
-                v.beta_alpha,
-                v.beta_beta,
-                size=self.n_samples,
-            )
-            for v in variants
-        }
+        impressions = np.fromiter((v.impressions for v in variants), np.int64, len(variants))
+        alphas, betas = self._beta_params(variants)
+        percentages = self.allocate(impressions, alphas, betas, seed)
+        return dict(zip((v.variant_name for v in variants), percentages.tolist()))
 
-        # Count wins for each variant (dicionário para as vitórias)
-        wins = {v.variant_name: 0 for v in variants}
+    def allocate(
+        self,
+        impressions: np.ndarray,
+        alphas: np.ndarray,
+        betas: np.ndarray,
+        seed: int | None = None,
+    ) -> np.ndarray:
+        """
+        Allocation percentages for variants given as parallel arrays.
+        
+        Seeded results are memoized on the inputs, so unchanged posteriors
+        are never sampled twice.
+        
+        Args:
+            impressions: Impressions of each variant
+            alphas: Posterior α of each variant
+            betas: Posterior β of each variant
+            seed: Random seed for reproducibility (optional)
+            
+        Returns:
+            Allocation percentages, aligned with the input arrays
+        """
+        if len(alphas) == 0:
+            return np.empty(0)
+        if seed is None:
+            return self._allocate(impressions, alphas, betas, seed)
 
-        # loop que roda 10K monte Carlo 
-        for i in range(self.n_samples):
-            # Find variant with highest sampled theta in this simulation
-            best_variant = max(
-                variants,
-                key=lambda v: samples[v.variant_name][i],
-            )
-            wins[best_variant.variant_name] += 1
+        key = (
+            self.n_samples,
+            seed,
+            impressions.tobytes(),
+            alphas.tobytes(),
+            betas.tobytes(),
+        )
+        percentages = _allocation_memo.get(key)
+        if percentages is None:
+            percentages = self._allocate(impressions, alphas, betas, seed)
+            _allocation_memo.set(key, percentages)
+        return percentages.copy()
 
-        # Convert wins to percentages
-        allocations = {
-            name: round((count / self.n_samples) * 100, 2)
-            for name, count in wins.items()
-        }
+    def _allocate(
+        self,
+        impressions: np.ndarray,
+        alphas: np.ndarray,
+        betas: np.ndarray,
+        seed: int | None,
+    ) -> np.ndarray:
+        """Compute the allocation (uncached); see `allocate`."""
+        n_variants = len(alphas)
+
+        # No data, or every variant at the same posterior (e.g. all at the
+        # prior): symmetric, so the allocation is uniform without sampling
+        if impressions.sum() == 0 or (
+            (alphas == alphas[0]).all() and (betas == betas[0]).all()
+        ):
+            return self._fix_rounding(np.full(n_variants, round(100.0 / n_variants, 2)))
+
+        # Converged experiment: the outcome is already certain
+        winner = self._dominant_index(alphas, betas)
+        if winner is not None:
+            percentages = np.zeros(n_variants)
+            percentages[winner] = 100.0
+            return percentages
+
+        # Typical A/B test: two arms have an exact answer, no sampling needed
+        if n_variants == 2:
+            percentages = self._two_arm_percentages(alphas, betas)
+            if percentages is not None:
+                return percentages
+
+        # Seeded calls get their own generator: reproducible for the seed
+        # without touching state shared across request threads
+        rng = self._rng if seed is None else np.random.default_rng(seed)
+        wins = self._count_wins(alphas, betas, rng)
+
+        # Convert wins to percentages (of the simulations actually run)
+        return self._fix_rounding((wins * (100.0 / wins.sum())).round(2))
+
+    @staticmethod
+    def _fix_rounding(percentages: np.ndarray) -> np.ndarray:
+        """Make rounded percentages sum to 100; the largest absorbs the residual."""
+        residual = round(100.0 - percentages.sum(), 2)
+        if abs(residual) > 1e-9:
+            largest = percentages.argmax()
+            percentages[largest] = round(percentages[largest] + residual, 2)
+        return percentages
+
+    @staticmethod
+    def _dominant_index(alphas: np.ndarray, betas: np.ndarray) -> Optional[int]:
+        """
+        Find a variant that wins virtually every draw.
+        
+        Uses the normal approximation of each posterior (only when it
+        applies to every variant, see `_normal_approx_applies`). If the
+        best variant's 99.99% credible interval lies entirely above all the
+        others', it
+        would take ~100% of the allocation after rounding anyway.
+        
+        Returns:
+            Index of the dominant variant, or None if the outcome isn't certain
+        """
+        if not ThompsonSamplingEngine._normal_approx_applies(alphas, betas):
+            return None
+
+        totals = alphas + betas
+        mu = alphas / totals
+        margin = Z_9999 * np.sqrt(mu * (1 - mu) / (totals + 1))
+        lower = mu - margin
+        upper = mu + margin
+
+        best = int(lower.argmax())
+        upper[best] = -np.inf
+        if upper.max() < lower[best]:
+            return best
+        return None
 
-        # Ensure allocations sum to 100% (handle rounding)
-        total = sum(allocations.values())
-        if total != 100.0:
-            # Adjust the largest allocation to make sum exactly 100
-            max_variant = max(allocations, key=allocations.get)
-            allocations[max_variant] += round(100.0 - total, 2)
+    @staticmethod
+    def _two_arm_percentages(alphas: np.ndarray, betas: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Allocate two arms by the exact probability that each one is best.
+        
+        This is the value Monte Carlo estimates, without the sampling noise.
+        The series has one term per unit of alpha, so it is summed over the
+        arm with the smaller alpha.
+        
+        Returns:
+            Allocation percentages for both arms, or None when the series
+            would be longer than EXACT_TWO_ARM_MAX_TERMS
+        """
+        a, b = (0, 1) if alphas[0] >= alphas[1] else (1, 0)
+        if alphas[b] > EXACT_TWO_ARM_MAX_TERMS:
+            return None
 
-        return allocations
+        p_b = probability_b_beats_a(alphas[a], betas[a], alphas[b], betas[b])
+        percentages = np.empty(2)
+        percentages[b] = round(p_b * 100, 2)
+        percentages[a] = round(100.0 - percentages[b], 2)
+        return percentages
+
+    @staticmethod
+    def _beta_params(variants: list[VariantData]) -> tuple[np.ndarray, np.ndarray]:
+        """Stack the posterior parameters into (alphas, betas) arrays."""
+        alphas = np.fromiter((v.beta_alpha for v in variants), float, len(variants))
+        betas = np.fromiter((v.beta_beta for v in variants), float, len(variants))
+        return alphas, betas
+
+    def _count_wins(
+        self,
+        alphas: np.ndarray,
+        betas: np.ndarray,
+        rng: np.random.Generator,
+    ) -> np.ndarray:
+        """
+        Count how many simulations each variant wins.
+        
+        Simulations run in doubling stages starting at EARLY_STOP_MIN_ROWS,
+        up to n_samples in total. After each stage sampling stops if the
+        leader's win rate is already known to within EARLY_STOP_HALF_WIDTH,
+        which happens when one variant wins nearly every draw.
+        
+        Returns:
+            Array of win counts, aligned with `alphas`/`betas`; sums to the
+            number of simulations actually run
+        """
+        wins = np.zeros(len(alphas), dtype=np.int64)
+        drawn = 0
+        stage = min(EARLY_STOP_MIN_ROWS, self.n_samples)
+        while drawn < self.n_samples:
+            rows = min(stage, self.n_samples - drawn)
+            wins += self._stage_wins(alphas, betas, rng, rows)
+            drawn += rows
+            if self._converged(wins, drawn):
+                break
+            stage = drawn
+        return wins
+
+    @staticmethod
+    def _converged(wins: np.ndarray, drawn: int) -> bool:
+        """Whether the leader's win rate is within EARLY_STOP_HALF_WIDTH (95%)."""
+        # A leader winning every draw gives a zero-width interval; from
+        # EARLY_STOP_MIN_ROWS draws its true rate is still > 99.7%
+        leader = wins.max() / drawn
+        return Z_95 * math.sqrt(leader * (1 - leader) / drawn) < EARLY_STOP_HALF_WIDTH
+
+    def _stage_wins(
+        self,
+        alphas: np.ndarray,
+        betas: np.ndarray,
+        rng: np.random.Generator,
+        rows: int,
+    ) -> np.ndarray:
+        """
+        Win counts over one stage of `rows` simulations.
+        
+        Stages are drawn and reduced SAMPLE_BLOCK_ROWS at a time; blocks of
+        a multi-block stage run on `_sampling_pool` when thompson_workers > 1.
+        """
+        if rows <= SAMPLE_BLOCK_ROWS:
+            return self._block_wins(alphas, betas, rng, rows)
+
+        # One child stream per block, so results don't depend on how many
+        # workers run the blocks or in which order they finish
+        sizes = [
+            min(SAMPLE_BLOCK_ROWS, rows - start)
+            for start in range(0, rows, SAMPLE_BLOCK_ROWS)
+        ]
+        run = _sampling_pool.map if _sampling_pool is not None else map
+        return sum(run(
+            self._block_wins, repeat(alphas), repeat(betas), rng.spawn(len(sizes)), sizes
+        ))
+
+    def _block_wins(
+        self,
+        alphas: np.ndarray,
+        betas: np.ndarray,
+        rng: np.random.Generator,
+        rows: int,
+    ) -> np.ndarray:
+        """Win counts over one block of `rows` simulations."""
+        samples = self._sample_ctr(alphas, betas, rng, rows)
+        # Winner of each simulation = column with the highest sampled θ
+        return np.bincount(samples.argmax(axis=1), minlength=len(alphas))
+
+    def _sample_ctr(
+        self,
+        alphas: np.ndarray,
+        betas: np.ndarray,
+        rng: np.random.Generator,
+        rows: int | None = None,
+    ) -> np.ndarray:
+        """
+        Draw θ from every variant's posterior in a single call per sampler.
+        
+        When every posterior has min(α, β) >= NORMAL_APPROX_MIN_PARAM, all
+        are drawn from N(μ, μ(1-μ)/(α+β+1)), clipped to [0, 1]: numpy's
+        Beta sampler goes through two Gamma draws per variate, a normal is
+        much cheaper. Otherwise all are drawn as a ratio of float32 Gamma
+        variates.
+        
+        Args:
+            alphas: Posterior α of each variant
+            betas: Posterior β of each variant
+            rng: Random generator to draw from
+            rows: Number of samples per variant (default: n_samples)
+            
+        Returns:
+            float32 array of shape (rows, len(alphas)); column j holds the
+            samples of variant j
+        """
+        rows = rows or self.n_samples
+        size = (rows, len(alphas))
+
+        # float32: argmax only needs ordering, and half the bytes keeps the
+        # matrix in cache for the reduction
+        if self._normal_approx_applies(alphas, betas):
+            totals = alphas + betas
+            mu = alphas / totals
+            sd = np.sqrt(mu * (1 - mu) / (totals + 1))
+            samples = rng.standard_normal(size=size, dtype=np.float32)
+            samples *= sd.astype(np.float32)
+            samples += mu.astype(np.float32)
+            return np.clip(samples, 0.0, 1.0, out=samples)
+
+        # Beta(α, β) = X / (X + Y) with X ~ Gamma(α), Y ~ Gamma(β), drawn
+        # in float32 (Generator.beta only produces float64)
+        x = rng.standard_gamma(alphas, size=size, dtype=np.float32)
+        y = rng.standard_gamma(betas, size=size, dtype=np.float32)
+        y += x
+        return np.divide(x, y, out=x)
+
+    @staticmethod
+    def _normal_approx_applies(alphas: np.ndarray, betas: np.ndarray) -> bool:
+        """Whether every posterior is symmetric enough to sample as a normal."""
+        return bool(np.minimum(alphas, betas).min() >= NORMAL_APPROX_MIN_PARAM)
 
 
 class AllocationService:
@@ -234,6 +686,11 @@ class AllocationService:
         4. Use deterministic seed for reproducibility
         5. Save result to allocation_history
         
+        Results are cached per (window_days, day) for `allocation_cache_ttl`
+        seconds; recording metrics invalidates the experiment's entries.
+        allocation_history gets one row per computed result, written when it
+        is first served with save_history; later cache hits add none.
+        
         Args:
             experiment_id: Experiment UUID
             window_days: Number of days to look back (default: 14)
@@ -248,44 +705,185 @@ class AllocationService:
         if window_days is None:
             window_days = self.default_window
 
+        cached = _get_cached_allocation(
+            experiment_id, window_days, computed_at.date(), save_history
+        )
+        if cached is not None:
+            return cached
+
         # Get experiment
         experiment = ExperimentRepository.get_experiment_by_id(experiment_id)
         if not experiment:
             return None
 
-        # Get metrics with initial window
-        metrics_data = MetricsRepository.get_metrics_for_allocation(
+        actual_window = window_days
+        if window_days < self.max_window:
+            # Read the initial and expanded windows in one round trip, so an
+            # expansion doesn't cost a second query
+            metrics_by_window = MetricsRepository.get_metrics_multi_window(
+                experiment_id, [window_days, self.max_window]
+            )
+            metrics_data = metrics_by_window[window_days]
+
+            # If insufficient data, expand
+            if self._needs_expansion(metrics_data, window_days):
+                actual_window = self.max_window
+                metrics_data = metrics_by_window[self.max_window]
+        else:
+            metrics_data = MetricsRepository.get_metrics_for_allocation(
+                experiment_id=experiment_id,
+                window_days=window_days,
+            )
+
+        result, record = self._build_allocation(
             experiment_id=experiment_id,
-            window_days=window_days,
+            experiment=experiment,
+            metrics_data=metrics_data,
+            actual_window=actual_window,
+            computed_at=computed_at,
+            start_time=start_time,
         )
-
-        # Check if any variant has insufficient data
-        min_variant_impressions = min(
-            (int(m["impressions"]) for m in metrics_data),
-            default=0
+        if save_history:
+            _save_history(experiment_id, record)
+        return _cache_allocation(
+            experiment_id, window_days, computed_at.date(), result,
+            None if save_history else record,
         )
+
+    def get_allocations(
+        self,
+        experiment_ids: list[str],
+        window_days: int | None = None,
+        save_history: bool = True,
+        refresh: bool = False,
+    ) -> list[AllocationResponse]:
+        """
+        Get allocations for several experiments with batched metric reads.
         
-        # Track if we used fallback
-        used_fallback = False
-        actual_window = window_days
+        Same logic and cache as `get_allocation`, but metrics for all
+        uncached experiments come from one query per window (initial +
+        expanded) instead of one or two queries per experiment.
         
-        # If insufficient data and not already at max window, expand
-        if min_variant_impressions < self.min_impressions and window_days < self.max_window:
-            actual_window = self.max_window
-            metrics_data = MetricsRepository.get_metrics_for_allocation(
-                experiment_id=experiment_id,
-                window_days=self.max_window,
+        Args:
+            experiment_ids: Experiment UUIDs
+            window_days: Number of days to look back (default: 14)
+            save_history: Whether to save to allocation_history (default: True)
+            refresh: Recompute and overwrite cached results instead of reading them
+            
+        Returns:
+            Allocation responses in request order; unknown experiments are skipped
+        """
+        start_time = time.time()
+        computed_at = datetime.utcnow()
+        
+        if window_days is None:
+            window_days = self.default_window
+
+        day = computed_at.date()
+        results = {}
+        experiments = {}
+        for experiment_id in dict.fromkeys(experiment_ids):
+            cached = (
+                None if refresh
+                else _get_cached_allocation(experiment_id, window_days, day, save_history)
             )
-            min_variant_impressions = min(
-                (int(m["impressions"]) for m in metrics_data),
-                default=0
+            if cached is not None:
+                results[experiment_id] = cached
+                continue
+            experiment = ExperimentRepository.get_experiment_by_id(experiment_id)
+            if experiment:
+                experiments[experiment_id] = experiment
+
+        if experiments:
+            metrics_by_experiment = MetricsRepository.get_metrics_for_allocation_many(
+                list(experiments), window_days
             )
+            windows = dict.fromkeys(experiments, window_days)
+            
+            # Expand the window for all under-sampled experiments in one query
+            to_expand = [
+                experiment_id
+                for experiment_id, metrics_data in metrics_by_experiment.items()
+                if self._needs_expansion(metrics_data, window_days)
+            ]
+            if to_expand:
+                metrics_by_experiment.update(
+                    MetricsRepository.get_metrics_for_allocation_many(to_expand, self.max_window)
+                )
+                windows.update(dict.fromkeys(to_expand, self.max_window))
 
-        # If still insufficient, mark as fallback (will use prior only)
-        if min_variant_impressions < self.min_impressions:
-            used_fallback = True
+            for experiment_id, experiment in experiments.items():
+                result, record = self._build_allocation(
+                    experiment_id=experiment_id,
+                    experiment=experiment,
+                    metrics_data=metrics_by_experiment[experiment_id],
+                    actual_window=windows[experiment_id],
+                    computed_at=computed_at,
+                    start_time=start_time,
+                )
+                if save_history:
+                    _save_history(experiment_id, record)
+                results[experiment_id] = _cache_allocation(
+                    experiment_id, window_days, day, result,
+                    None if save_history else record,
+                )
+
+        return [
+            results[experiment_id]
+            for experiment_id in dict.fromkeys(experiment_ids)
+            if experiment_id in results
+        ]
+
+    def refresh_allocations(self) -> int:
+        """
+        Recompute and cache the default-window allocation of every active experiment.
+        
+        Run periodically by `run_allocation_refresh` so requests are served
+        from the cache instead of computing on a miss. Nothing is written to
+        allocation_history here: a refreshed result is recorded when it is
+        first served (see `get_allocation`). An unchanged result keeps its
+        cached entry, including computed_at and the ETag built from it.
+        
+        Returns:
+            Number of experiments refreshed
+        """
+        experiment_ids = ExperimentRepository.get_active_experiment_ids()
+        refreshed = 0
+        for i in range(0, len(experiment_ids), REFRESH_BATCH_SIZE):
+            refreshed += len(self.get_allocations(
+                experiment_ids[i:i + REFRESH_BATCH_SIZE],
+                save_history=False,
+                refresh=True,
+            ))
+        return refreshed
+
+    @staticmethod
+    def _min_impressions(metrics_data: list[dict]) -> int:
+        """Smallest impression count across variants (0 if none)."""
+        return min((int(m["impressions"]) for m in metrics_data), default=0)
 
-        # Convert to VariantData objects
+    def _needs_expansion(self, metrics_data: list[dict], window_days: int) -> bool:
+        """Whether a variant is under-sampled and the window can still grow."""
+        # Window check first: at the max window the rows aren't scanned
+        return (
+            window_days < self.max_window
+            and self._min_impressions(metrics_data) < self.min_impressions
+        )
+
+    @staticmethod
+    def _build_variant_data(
+        metrics_data: list[dict],
+    ) -> tuple[list[VariantData], np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Convert allocation query rows, once per request.
+        
+        Everything downstream reads the converted values instead of the raw
+        rows: the VariantData list feeds the response and history, the
+        parallel arrays feed the fallback check and the engine.
+        
+        Returns:
+            Tuple of (variants, impressions, alphas, betas), aligned by index
+        """
         variants = [
             VariantData(
                 variant_id=m["variant_id"],
@@ -299,97 +897,113 @@ class AllocationService:
             )
             for m in metrics_data
         ]
+        impressions = np.fromiter((v.impressions for v in variants), np.int64, len(variants))
+        alphas, betas = ThompsonSamplingEngine._beta_params(variants)
+        return variants, impressions, alphas, betas
+
+    def _build_allocation(
+        self,
+        experiment_id: str,
+        experiment: dict,
+        metrics_data: list[dict],
+        actual_window: int,
+        computed_at: datetime,
+        start_time: float,
+    ) -> tuple[AllocationResponse, dict]:
+        """
+        Run Thompson Sampling on fetched metrics and build the response.
+        
+        Returns:
+            Tuple of (response, allocation_history record for `_save_history`)
+        """
+        variants, impressions, alphas, betas = self._build_variant_data(metrics_data)
+
+        # If still insufficient, mark as fallback (will use prior only)
+        used_fallback = (impressions.min() if len(impressions) else 0) < self.min_impressions
 
         # Generate deterministic seed
         seed = generate_deterministic_seed(experiment_id, computed_at.date())
 
-        # Calculate allocation with seed
-        allocations = self.engine.calculate_allocation(variants, seed=seed)
+        # Calculate allocation with seed (aligned with `variants`)
+        allocated = self.engine.allocate(impressions, alphas, betas, seed=seed)
+        percentages = allocated.tolist()
+
+        # Response order: control first, then by allocation descending.
+        # lexsort is stable and its last key is the primary one
+        is_control = np.fromiter((v.is_control for v in variants), bool, len(variants))
+        order = np.lexsort((-allocated, ~is_control)).tolist()
+
+        # CTR intervals, shared by the response and history
+        clicks = np.fromiter((v.clicks for v in variants), np.int64, len(variants))
+        intervals = wilson_score_intervals(clicks, impressions)
 
         # Build response
         variant_allocations = []
-        for v in variants:
+        for i in order:
+            v = variants[i]
             variant_allocations.append(
                 VariantAllocation(
                     variant_name=v.variant_name,
                     is_control=v.is_control,
-                    allocation_percentage=allocations.get(v.variant_name, 0.0),
+                    allocation_percentage=percentages[i],
                     metrics=VariantMetrics(
                         impressions=v.impressions,
                         clicks=v.clicks,
                         ctr=round(v.ctr, 6),
-                        ctr_ci=wilson_score_interval(v.clicks, v.impressions),
+                        ctr_ci=intervals[i],
                     ),
                 )
             )
 
-        # Sort: control first, then by allocation descending
-        variant_allocations.sort(
-            key=lambda x: (-x.is_control, -x.allocation_percentage)
-        )
-
         # Build algorithm description
         algorithm_name = "thompson_sampling"
         algorithm_desc = algorithm_name
         if used_fallback:
             algorithm_desc += " (fallback: prior only)"
 
-        # Save to history
-        if save_history:
-            try:
-                # Build variant data with CI
-                variants_for_history = []
-                for v in variants:
-                    ci = wilson_score_interval(v.clicks, v.impressions)
-                    variants_for_history.append({
-                        "variant_id": v.variant_id,
-                        "variant_name": v.variant_name,
-                        "is_control": v.is_control,
-                        "allocation_percentage": allocations.get(v.variant_name, 0.0),
-                        "impressions": v.impressions,
-                        "clicks": v.clicks,
-                        "ctr": v.ctr,
-                        "ctr_ci_lower": ci.lower if ci else None,
-                        "ctr_ci_upper": ci.upper if ci else None,
-                        "beta_alpha": v.beta_alpha,
-                        "beta_beta": v.beta_beta,
-                    })
-                
-                AllocationHistoryRepository.save_allocation(
-                    experiment_id=experiment_id,
-                    computed_at=computed_at,
-                    window_days=actual_window,
-                    algorithm=algorithm_name,
-                    algorithm_version=ALGORITHM_VERSION,
-                    seed=seed,
-                    used_fallback=used_fallback,
-                    variants=variants_for_history,
-                )
-            except Exception as e:
-                # Log but don't fail the request if history save fails
-                from src.logging_config import log_error
-                log_error(
-                    message=f"Failed to save allocation history: {e}",
-                    error_type="allocation_history_save",
-                    experiment_id=experiment_id,
-                )
+        # History record (variant data with CI), saved now or when served
+        variants_for_history = []
+        for v, percentage, ci in zip(variants, percentages, intervals):
+            variants_for_history.append({
+                "variant_id": v.variant_id,
+                "variant_name": v.variant_name,
+                "is_control": v.is_control,
+                "allocation_percentage": percentage,
+                "impressions": v.impressions,
+                "clicks": v.clicks,
+                "ctr": v.ctr,
+                "ctr_ci_lower": ci.lower if ci else None,
+                "ctr_ci_upper": ci.upper if ci else None,
+                "beta_alpha": v.beta_alpha,
+                "beta_beta": v.beta_beta,
+            })
+        record = {
+            "computed_at": computed_at,
+            "window_days": actual_window,
+            "algorithm": algorithm_name,
+            "algorithm_version": ALGORITHM_VERSION,
+            "seed": seed,
+            "used_fallback": used_fallback,
+            "variants": variants_for_history,
+        }
 
-        # Log algorithm execution
-        duration_ms = (time.time() - start_time) * 1000
-        log_algorithm(
-            algorithm=algorithm_name,
-            experiment_id=experiment_id,
-            duration_ms=duration_ms,
-            n_samples=self.engine.n_samples,
-            num_variants=len(variants),
-            total_impressions=sum(v.impressions for v in variants),
-            window_days=actual_window,
-            used_fallback=used_fallback,
-            seed=seed,
-            algorithm_version=ALGORITHM_VERSION,
-        )
+        # Log algorithm execution (skip building the record if INFO is off)
+        if logger.isEnabledFor(logging.INFO):
+            duration_ms = (time.time() - start_time) * 1000
+            log_algorithm(
+                algorithm=algorithm_name,
+                experiment_id=experiment_id,
+                duration_ms=duration_ms,
+                n_samples=self.engine.n_samples,
+                num_variants=len(variants),
+                total_impressions=int(impressions.sum()),
+                window_days=actual_window,
+                used_fallback=used_fallback,
+                seed=seed,
+                algorithm_version=ALGORITHM_VERSION,
+            )
 
-        return AllocationResponse(
+        response = AllocationResponse(
             experiment_id=experiment_id,
             experiment_name=experiment["name"],
             computed_at=computed_at,
@@ -397,3 +1011,27 @@ class AllocationService:
             window_days=actual_window,
             allocations=variant_allocations,
         )
+        return response, record
+
+
+# Holds no per-request state, so one instance (and engine) serves every
+# request and the background refresh
+allocation_service = AllocationService()
+
+
+async def run_allocation_refresh(interval: float) -> None:
+    """
+    Refresh active experiments' allocations every `interval` seconds.
+    
+    Runs until cancelled; the blocking refresh runs in a worker thread and
+    failures are logged without stopping the loop.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(allocation_service.refresh_allocations)
+        except Exception as exc:
+            log_error(
+                message=f"Allocation refresh failed: {exc}",
+                error_type=type(exc).__name__,
+            )
+        await asyncio.sleep(interval)
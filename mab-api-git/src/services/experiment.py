@@ -3,10 +3,12 @@
 from datetime import date
 from typing import Optional
 
+from src.config import settings
 from src.repositories.experiment import ExperimentRepository
 from src.repositories.metrics import MetricsRepository
 from src.models.experiment import ExperimentCreate, ExperimentResponse, VariantResponse
 from src.models.metrics import MetricsBatchRequest, MetricsResponse
+from src.services.allocation import invalidate_allocation_cache
 
 
 class ExperimentService:
@@ -123,19 +125,27 @@ class ExperimentService:
                     f"Variant '{metric.variant_name}' not found in experiment"
                 )
 
-        # Insert metrics
-        for metric in data.metrics:
-            variant_id = variants[metric.variant_name]
-            MetricsRepository.insert_metrics(
-                variant_id=variant_id,
-                metric_date=data.date,
-                impressions=metric.impressions,
-                clicks=metric.clicks,
-                sessions=metric.sessions,
-                revenue=metric.revenue,
-                source=data.source,
-                batch_id=data.batch_id,
-            )
+        rows = [
+            {
+                "variant_id": variants[metric.variant_name],
+                "metric_date": data.date,
+                "impressions": metric.impressions,
+                "clicks": metric.clicks,
+                "sessions": metric.sessions,
+                "revenue": metric.revenue,
+                "source": data.source,
+                "batch_id": data.batch_id,
+            }
+            for metric in data.metrics
+        ]
+        
+        # Large batches go through PUT + COPY INTO, the rest in one request
+        if len(rows) >= settings.metrics_copy_threshold:
+            MetricsRepository.bulk_copy_metrics(experiment_id, rows)
+        else:
+            MetricsRepository.insert_metrics_bulk(experiment_id, rows)
+        ExperimentRepository.invalidate_cache(experiment_id)
+        invalidate_allocation_cache(experiment_id)
 
         return MetricsResponse(
             message="Metrics recorded successfully",
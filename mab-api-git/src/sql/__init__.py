@@ -1,18 +1,55 @@
 """SQL queries for the MAB API."""
 
+from functools import lru_cache
+
+# Metric row ids are generated server-side with UUID_STRING()
+_RAW_METRIC_COLUMNS = (
+    "variant_id", "metric_date", "sessions", "impressions",
+    "clicks", "revenue", "source", "batch_id",
+)
+_DAILY_METRIC_COLUMNS = (
+    "variant_id", "metric_date", "sessions", "impressions",
+    "clicks", "revenue",
+)
+
+
+def _values_rows(prefix: str, columns: tuple[str, ...], count: int) -> str:
+    """Render `count` VALUES tuples with `%(<prefix>_<column>_<i>)s` placeholders."""
+    return ",\n            ".join(
+        "(" + ", ".join(f"%({prefix}_{column}_{i})s" for column in columns) + ")"
+        for i in range(count)
+    )
+
 
 class ExperimentQueries:
     """SQL queries for experiments."""
 
     INSERT = """
-        INSERT INTO experiments (id, name, description, status)
-        VALUES (%(id)s, %(name)s, %(description)s, %(status)s)
+        INSERT INTO experiments (id, name, description, status, created_at, updated_at)
+        VALUES (
+            %(id)s, %(name)s, %(description)s, %(status)s,
+            %(created_at)s, %(created_at)s
+        )
     """
 
-    SELECT_BY_ID = """
-        SELECT id, name, description, status, created_at, updated_at
-        FROM experiments
-        WHERE id = %(id)s
+    # One row per variant (a single row with NULL variant columns when the
+    # experiment has none), grouped back into a nested dict by the repository
+    SELECT_BY_ID_WITH_VARIANTS = """
+        SELECT
+            e.id,
+            e.name,
+            e.description,
+            e.status,
+            e.created_at,
+            e.updated_at,
+            v.id AS variant_id,
+            v.name AS variant_name,
+            v.is_control AS variant_is_control,
+            v.created_at AS variant_created_at
+        FROM experiments e
+        LEFT JOIN variants v ON v.experiment_id = e.id
+        WHERE e.id = %(id)s
+        ORDER BY v.is_control DESC, v.name
     """
 
     SELECT_BY_NAME = """
@@ -21,9 +58,22 @@ class ExperimentQueries:
         WHERE name = %(name)s
     """
 
+    SELECT_ACTIVE_IDS = """
+        SELECT id
+        FROM experiments
+        WHERE status = 'active'
+        ORDER BY created_at
+    """
+
     UPDATE_STATUS = """
         UPDATE experiments
-        SET status = %(status)s, updated_at = CURRENT_TIMESTAMP()
+        SET status = %(status)s, updated_at = %(updated_at)s
+        WHERE id = %(id)s
+    """
+
+    TOUCH = """
+        UPDATE experiments
+        SET updated_at = %(updated_at)s
         WHERE id = %(id)s
     """
 
@@ -32,8 +82,8 @@ class VariantQueries:
     """SQL queries for variants."""
 
     INSERT = """
-        INSERT INTO variants (id, experiment_id, name, is_control)
-        VALUES (%(id)s, %(experiment_id)s, %(name)s, %(is_control)s)
+        INSERT INTO variants (id, experiment_id, name, is_control, created_at)
+        VALUES (%(id)s, %(experiment_id)s, %(name)s, %(is_control)s, %(created_at)s)
     """
 
     SELECT_BY_EXPERIMENT = """
@@ -50,30 +100,70 @@ class VariantQueries:
     """
 
 
+# Smallest VALUES list a metrics batch is padded to (see bulk_batch_size)
+_MIN_BULK_BATCH_SIZE = 8
+
+
 class MetricsQueries:
     """SQL queries for metrics."""
 
-    INSERT_RAW = """
-        INSERT INTO raw_metrics (id, variant_id, metric_date, sessions, impressions, clicks, revenue, source, batch_id)
-        VALUES (%(id)s, %(variant_id)s, %(metric_date)s, %(sessions)s, %(impressions)s, %(clicks)s, %(revenue)s, %(source)s, %(batch_id)s)
-    """
+    @staticmethod
+    def bulk_batch_size(count: int) -> int:
+        """
+        Number of VALUES rows a batch of `count` metrics is padded to.
+        
+        Powers of two from _MIN_BULK_BATCH_SIZE, so the bulk statement has a
+        handful of distinct texts (and compiled plans) instead of one per
+        batch length.
+        """
+        size = _MIN_BULK_BATCH_SIZE
+        while size < count:
+            size *= 2
+        return size
 
-    UPSERT_DAILY = """
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def insert_raw_and_upsert_daily_bulk(size: int) -> str:
+        """
+        Build a three-statement request writing a whole metrics batch.
+        
+        A multi-row INSERT into raw_metrics, one MERGE into daily_metrics
+        over a VALUES list, then the experiment's updated_at bump
+        (`ExperimentQueries.TOUCH`); run with num_statements=3.
+        Placeholders are `raw_<column>_<i>`, `daily_<column>_<i>`, `id`
+        and `updated_at`. Both VALUES lists have `size` rows; unused rows
+        are bound as NULLs and filtered out. Daily rows must be unique per
+        (variant_id, metric_date).
+        
+        Args:
+            size: VALUES rows per table, from `bulk_batch_size`
+            
+        Returns:
+            SQL text with pyformat placeholders
+        """
+        return f"""
+        INSERT INTO raw_metrics (id, variant_id, metric_date, sessions, impressions, clicks, revenue, source, batch_id)
+        SELECT UUID_STRING(), column1, column2, column3, column4, column5, column6, column7, column8
+        FROM VALUES
+            {_values_rows("raw", _RAW_METRIC_COLUMNS, size)}
+        WHERE column1 IS NOT NULL;
         MERGE INTO daily_metrics AS target
         USING (
-            SELECT 
-                %(id)s AS id,
-                %(variant_id)s AS variant_id,
-                %(metric_date)s AS metric_date,
-                %(sessions)s AS sessions,
-                %(impressions)s AS impressions,
-                %(clicks)s AS clicks,
-                %(revenue)s AS revenue
+            SELECT
+                column1 AS variant_id,
+                column2 AS metric_date,
+                column3 AS sessions,
+                column4 AS impressions,
+                column5 AS clicks,
+                column6 AS revenue
+            FROM VALUES
+            {_values_rows("daily", _DAILY_METRIC_COLUMNS, size)}
+            WHERE column1 IS NOT NULL
         ) AS source
-        ON target.variant_id = source.variant_id 
+        ON target.variant_id = source.variant_id
            AND target.metric_date = source.metric_date
         WHEN MATCHED THEN
-            UPDATE SET 
+            UPDATE SET
                 sessions = source.sessions,
                 impressions = source.impressions,
                 clicks = source.clicks,
@@ -81,8 +171,9 @@ class MetricsQueries:
                 updated_at = CURRENT_TIMESTAMP()
         WHEN NOT MATCHED THEN
             INSERT (id, variant_id, metric_date, sessions, impressions, clicks, revenue)
-            VALUES (source.id, source.variant_id, source.metric_date, source.sessions, source.impressions, source.clicks, source.revenue)
-    """
+            VALUES (UUID_STRING(), source.variant_id, source.metric_date, source.sessions, source.impressions, source.clicks, source.revenue);
+        {ExperimentQueries.TOUCH.strip()}
+        """
 
     SELECT_FOR_ALLOCATION = """
         WITH aggregated AS (
@@ -106,9 +197,11 @@ class MetricsQueries:
             is_control,
             impressions,
             clicks,
+            -- FLOAT, not a scaled NUMBER: the driver returns a Python float
+            -- instead of building a Decimal per row
             CASE 
-                WHEN impressions > 0 THEN clicks / impressions 
-                ELSE 0 
+                WHEN impressions > 0 THEN clicks::FLOAT / impressions 
+                ELSE 0::FLOAT 
             END AS ctr,
             clicks + %(prior_alpha)s AS beta_alpha,
             impressions - clicks + %(prior_beta)s AS beta_beta
@@ -116,38 +209,227 @@ class MetricsQueries:
         ORDER BY is_control DESC, variant_name
     """
 
-    SELECT_HISTORY = """
+    # Stage + merge path for large batches: rows are PUT as a CSV file to
+    # a session temp table's stage, loaded with COPY INTO, then written to
+    # both tables with set-based statements
+    CREATE_STAGE_TABLE = """
+        CREATE OR REPLACE TEMPORARY TABLE metrics_stage (
+            seq INTEGER,
+            variant_id VARCHAR(36),
+            metric_date DATE,
+            sessions BIGINT,
+            impressions BIGINT,
+            clicks BIGINT,
+            revenue DECIMAL(18,6),
+            source VARCHAR(50),
+            batch_id VARCHAR(36)
+        )
+    """
+
+    PUT_STAGE_FILE = """
+        PUT file://metrics_stage.csv @%metrics_stage AUTO_COMPRESS = TRUE OVERWRITE = TRUE
+    """
+
+    COPY_STAGE_FILE = """
+        COPY INTO metrics_stage
+        FROM @%metrics_stage
+        FILE_FORMAT = (TYPE = CSV FIELD_OPTIONALLY_ENCLOSED_BY = '"' NULL_IF = (''))
+        PURGE = TRUE
+    """
+
+    INSERT_RAW_FROM_STAGE = """
+        INSERT INTO raw_metrics (id, variant_id, metric_date, sessions, impressions, clicks, revenue, source, batch_id)
+        SELECT UUID_STRING(), variant_id, metric_date, sessions, impressions, clicks, revenue, source, batch_id
+        FROM metrics_stage
+    """
+
+    # Last row per (variant_id, metric_date) wins, as with sequential upserts
+    UPSERT_DAILY_FROM_STAGE = """
+        MERGE INTO daily_metrics AS target
+        USING (
+            SELECT variant_id, metric_date, sessions, impressions, clicks, revenue
+            FROM metrics_stage
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY variant_id, metric_date ORDER BY seq DESC
+            ) = 1
+        ) AS source
+        ON target.variant_id = source.variant_id
+           AND target.metric_date = source.metric_date
+        WHEN MATCHED THEN
+            UPDATE SET
+                sessions = source.sessions,
+                impressions = source.impressions,
+                clicks = source.clicks,
+                revenue = source.revenue,
+                updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN
+            INSERT (id, variant_id, metric_date, sessions, impressions, clicks, revenue)
+            VALUES (UUID_STRING(), source.variant_id, source.metric_date, source.sessions, source.impressions, source.clicks, source.revenue)
+    """
+
+    DROP_STAGE_TABLE = """
+        DROP TABLE IF EXISTS metrics_stage
+    """
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def select_for_allocation_many(count: int) -> str:
+        """
+        Build SELECT_FOR_ALLOCATION for several experiments at once.
+        
+        Same columns plus experiment_id, for experiments bound as
+        `experiment_id_<i>` placeholders in an IN list.
+        
+        Args:
+            count: Number of experiment IDs
+            
+        Returns:
+            SQL text with pyformat placeholders
+        """
+        placeholders = ", ".join(f"%(experiment_id_{i})s" for i in range(count))
+        return f"""
+        WITH aggregated AS (
+            SELECT 
+                v.experiment_id,
+                v.id AS variant_id,
+                v.name AS variant_name,
+                v.is_control,
+                COALESCE(SUM(m.impressions), 0) AS impressions,
+                COALESCE(SUM(m.clicks), 0) AS clicks
+            FROM variants v
+            LEFT JOIN daily_metrics m 
+                ON m.variant_id = v.id
+                AND m.metric_date >= DATEADD(day, -%(window_days)s, CURRENT_DATE())
+                AND m.metric_date < CURRENT_DATE()
+            WHERE v.experiment_id IN ({placeholders})
+            GROUP BY v.experiment_id, v.id, v.name, v.is_control
+        )
         SELECT 
-            m.metric_date,
-            v.id AS variant_id,
-            v.name AS variant_name,
-            v.is_control,
-            m.impressions,
-            m.clicks,
+            experiment_id,
+            variant_id,
+            variant_name,
+            is_control,
+            impressions,
+            clicks,
+            -- FLOAT, not a scaled NUMBER: the driver returns a Python float
+            -- instead of building a Decimal per row
             CASE 
-                WHEN m.impressions > 0 THEN m.clicks / m.impressions 
-                ELSE 0 
-            END AS ctr
-        FROM daily_metrics m
-        JOIN variants v ON v.id = m.variant_id
-        WHERE v.experiment_id = %(experiment_id)s
-        ORDER BY m.metric_date DESC, v.is_control DESC, v.name
-        LIMIT 90
+                WHEN impressions > 0 THEN clicks::FLOAT / impressions 
+                ELSE 0::FLOAT 
+            END AS ctr,
+            clicks + %(prior_alpha)s AS beta_alpha,
+            impressions - clicks + %(prior_beta)s AS beta_beta
+        FROM aggregated
+        ORDER BY experiment_id, is_control DESC, variant_name
+        """
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def select_for_allocation_windows(count: int) -> str:
+        """
+        Build SELECT_FOR_ALLOCATION for several windows at once.
+
+        The join reads the widest window (`window_days`) and each window
+        `window_days_<i>` is a conditional sum over it, returned as
+        `<column>_<i>` (impressions, clicks, ctr, beta_alpha, beta_beta).
+
+        Args:
+            count: Number of windows
+
+        Returns:
+            SQL text with pyformat placeholders
+        """
+        sums = ",\n".join(
+            f"""                COALESCE(SUM(CASE WHEN m.metric_date >= DATEADD(day, -%(window_days_{i})s, CURRENT_DATE())
+                    THEN m.{column} END), 0) AS {column}_{i}"""
+            for i in range(count)
+            for column in ("impressions", "clicks")
+        )
+        columns = ",\n".join(
+            f"""            impressions_{i},
+            clicks_{i},
+            CASE
+                WHEN impressions_{i} > 0 THEN clicks_{i}::FLOAT / impressions_{i}
+                ELSE 0::FLOAT
+            END AS ctr_{i},
+            clicks_{i} + %(prior_alpha)s AS beta_alpha_{i},
+            impressions_{i} - clicks_{i} + %(prior_beta)s AS beta_beta_{i}"""
+            for i in range(count)
+        )
+        return f"""
+        WITH aggregated AS (
+            SELECT
+                v.id AS variant_id,
+                v.name AS variant_name,
+                v.is_control,
+{sums}
+            FROM variants v
+            LEFT JOIN daily_metrics m
+                ON m.variant_id = v.id
+                AND m.metric_date >= DATEADD(day, -%(window_days)s, CURRENT_DATE())
+                AND m.metric_date < CURRENT_DATE()
+            WHERE v.experiment_id = %(experiment_id)s
+            GROUP BY v.id, v.name, v.is_control
+        )
+        SELECT
+            variant_id,
+            variant_name,
+            is_control,
+{columns}
+        FROM aggregated
+        ORDER BY is_control DESC, variant_name
+        """
+
+    # Existence check and history in one statement: no rows means the
+    # experiment doesn't exist, one row with NULL metrics means no history
+    SELECT_EXPERIMENT_HISTORY = """
+        WITH exp AS (
+            SELECT id, name
+            FROM experiments
+            WHERE id = %(experiment_id)s
+        ),
+        history AS (
+            SELECT 
+                m.metric_date,
+                v.id AS variant_id,
+                v.name AS variant_name,
+                v.is_control,
+                m.impressions,
+                m.clicks,
+                -- FLOAT, same as the allocation queries: no Decimal per row
+                CASE 
+                    WHEN m.impressions > 0 THEN m.clicks::FLOAT / m.impressions 
+                    ELSE 0::FLOAT 
+                END AS ctr
+            FROM daily_metrics m
+            JOIN variants v ON v.id = m.variant_id
+            WHERE v.experiment_id = %(experiment_id)s
+                -- Optional date range (NULL = open), applied before the limit
+                AND (%(start_date)s IS NULL OR m.metric_date >= %(start_date)s)
+                AND (%(end_date)s IS NULL OR m.metric_date <= %(end_date)s)
+            ORDER BY m.metric_date DESC, v.is_control DESC, v.name
+            LIMIT 90
+        )
+        SELECT exp.name AS experiment_name, h.*
+        FROM exp
+        LEFT JOIN history h ON TRUE
+        ORDER BY h.metric_date DESC, h.is_control DESC, h.variant_name
     """
 
 
 class AllocationHistoryQueries:
     """SQL queries for allocation history."""
 
+    # One row per computation, variants nested in the VARIANT column.
+    # INSERT ... SELECT because Snowflake rejects PARSE_JSON inside VALUES
     INSERT = """
         INSERT INTO allocation_history (
             id, experiment_id, computed_at, window_days, 
             algorithm, algorithm_version, seed, used_fallback,
             total_impressions, total_clicks, allocations
         )
-        VALUES (
+        SELECT
             %(id)s, %(experiment_id)s, %(computed_at)s, %(window_days)s,
             %(algorithm)s, %(algorithm_version)s, %(seed)s, %(used_fallback)s,
             %(total_impressions)s, %(total_clicks)s, PARSE_JSON(%(allocations)s)
-        )
     """
@@ -7,6 +7,18 @@ from unittest.mock import MagicMock, patch
 from src.main import app
 
 
+@pytest.fixture(autouse=True)
+def clear_allocation_cache():
+    """Keep cached allocations from leaking between tests."""
+    from src.services.allocation import _allocation_cache, _allocation_memo
+    
+    _allocation_cache.clear()
+    _allocation_memo.clear()
+    yield
+    _allocation_cache.clear()
+    _allocation_memo.clear()
+
+
 @pytest.fixture
 def client():
     """Create test client."""
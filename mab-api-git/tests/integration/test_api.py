@@ -2,7 +2,8 @@
 
 import pytest
 from unittest.mock import patch, MagicMock
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
 
 
 def utc_now():
@@ -10,6 +11,11 @@ def utc_now():
     return datetime.now(timezone.utc)
 
 
+def _by_window(rows):
+    """Side effect para get_metrics_multi_window: mesmas linhas em toda janela."""
+    return lambda experiment_id, windows: {window: rows for window in windows}
+
+
 class TestHealthEndpoint:
     """Tests for health check endpoint."""
 
@@ -104,6 +110,62 @@ class TestExperimentEndpoints:
 
         assert response.status_code == 200
         assert response.json()["id"] == "exp_123"
+        assert response.headers["Cache-Control"] == "no-cache"
+
+    @patch("src.services.experiment.ExperimentRepository")
+    def test_get_experiment_etag(self, mock_repo, client):
+        """Should return 304 until updated_at changes."""
+        record = {
+            "id": "exp_123",
+            "name": "test_experiment",
+            "description": None,
+            "status": "active",
+            "variants": [
+                {"id": "var_001", "name": "control", "is_control": True, "created_at": utc_now()},
+            ],
+            "created_at": utc_now(),
+            "updated_at": utc_now(),
+        }
+        mock_repo.get_experiment_by_id.return_value = record
+
+        etag = client.get("/experiments/exp_123").headers["ETag"]
+        cached = client.get("/experiments/exp_123", headers={"If-None-Match": etag})
+        record["updated_at"] = utc_now() + timedelta(seconds=1)
+        changed = client.get("/experiments/exp_123", headers={"If-None-Match": etag})
+
+        assert cached.status_code == 304
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+
+    @pytest.mark.parametrize("header, status", [
+        ('"other", {etag}', 304),
+        ("W/{etag}", 304),
+        ("*", 304),
+        ('"x{tag}x"', 200),
+        ('"other"', 200),
+    ])
+    @patch("src.services.experiment.ExperimentRepository")
+    def test_if_none_match_compares_whole_tags(self, mock_repo, header, status, client):
+        """If-None-Match should match listed tags exactly (or *), not substrings."""
+        mock_repo.get_experiment_by_id.return_value = {
+            "id": "exp_123",
+            "name": "test_experiment",
+            "description": None,
+            "status": "active",
+            "variants": [
+                {"id": "var_001", "name": "control", "is_control": True, "created_at": utc_now()},
+            ],
+            "created_at": utc_now(),
+            "updated_at": utc_now(),
+        }
+        etag = client.get("/experiments/exp_123").headers["ETag"]
+
+        response = client.get(
+            "/experiments/exp_123",
+            headers={"If-None-Match": header.format(etag=etag, tag=etag.strip('"'))},
+        )
+
+        assert response.status_code == status
 
     @patch("src.services.experiment.ExperimentRepository")
     def test_get_experiment_not_found(self, mock_repo, client):
@@ -138,6 +200,30 @@ class TestMetricsEndpoints:
         assert response.status_code == 201
         data = response.json()
         assert data["variants_updated"] == 2
+        assert mock_metrics_repo.insert_metrics_bulk.call_args.args[0] == "exp_123"
+        mock_exp_repo.invalidate_cache.assert_called_once_with("exp_123")
+
+    @patch("src.services.experiment.settings.metrics_copy_threshold", 2)
+    @patch("src.services.experiment.MetricsRepository")
+    @patch("src.services.experiment.ExperimentRepository")
+    def test_record_metrics_large_batch_uses_copy(
+        self, mock_exp_repo, mock_metrics_repo, client, sample_metrics_data
+    ):
+        """Batches at the threshold should load through PUT + COPY INTO."""
+        mock_exp_repo.get_experiment_by_id.return_value = {
+            "id": "exp_123",
+            "status": "active",
+            "variants": [
+                {"id": "var_001", "name": "control"},
+                {"id": "var_002", "name": "variant_a"},
+            ],
+        }
+
+        response = client.post("/experiments/exp_123/metrics", json=sample_metrics_data)
+
+        assert response.status_code == 201
+        mock_metrics_repo.bulk_copy_metrics.assert_called_once()
+        mock_metrics_repo.insert_metrics_bulk.assert_not_called()
 
     @patch("src.services.experiment.ExperimentRepository")
     def test_record_metrics_experiment_not_found(
@@ -210,7 +296,7 @@ class TestAllocationEndpoints:
             "name": "test_experiment",
             "status": "active",
         }
-        mock_metrics_repo.get_metrics_for_allocation.return_value = [
+        mock_metrics_repo.get_metrics_multi_window.side_effect = _by_window([
             {
                 "variant_id": "var_001",
                 "variant_name": "control",
@@ -231,7 +317,7 @@ class TestAllocationEndpoints:
                 "beta_alpha": 451,
                 "beta_beta": 9649,
             },
-        ]
+        ])
         mock_history_repo.save_allocation.return_value = "history_123"
 
         response = client.get("/experiments/exp_123/allocation")
@@ -283,7 +369,7 @@ class TestAllocationEndpoints:
             "name": "test_experiment",
             "status": "active",
         }
-        mock_metrics_repo.get_metrics_for_allocation.return_value = [
+        mock_metrics_repo.get_metrics_multi_window.side_effect = _by_window([
             {
                 "variant_id": "var_001",
                 "variant_name": "control",
@@ -294,13 +380,16 @@ class TestAllocationEndpoints:
                 "beta_alpha": 1,
                 "beta_beta": 99,
             },
-        ]
+        ])
 
         response = client.get("/experiments/exp_123/allocation?window_days=7")
 
         assert response.status_code == 200
         # Window might be expanded due to insufficient data
         assert response.json()["window_days"] >= 7
+        # Expansion reads both windows in a single query
+        mock_metrics_repo.get_metrics_multi_window.assert_called_once_with("exp_123", [7, 30])
+        mock_metrics_repo.get_metrics_for_allocation.assert_not_called()
 
     @patch("src.services.allocation.AllocationHistoryRepository")
     @patch("src.services.allocation.MetricsRepository")
@@ -319,7 +408,7 @@ class TestAllocationEndpoints:
             "name": "test_experiment",
             "status": "active",
         }
-        mock_metrics_repo.get_metrics_for_allocation.return_value = [
+        mock_metrics_repo.get_metrics_multi_window.side_effect = _by_window([
             {
                 "variant_id": "var_001",
                 "variant_name": "control",
@@ -340,7 +429,7 @@ class TestAllocationEndpoints:
                 "beta_alpha": 1,
                 "beta_beta": 99,
             },
-        ]
+        ])
 
         response = client.get("/experiments/exp_123/allocation")
 
@@ -350,3 +439,463 @@ class TestAllocationEndpoints:
         # Should be uniform (50% each)
         for alloc in allocations:
             assert alloc["allocation_percentage"] == 50.0
+
+    @patch("src.services.allocation.AllocationHistoryRepository")
+    @patch("src.services.allocation.MetricsRepository")
+    @patch("src.services.allocation.ExperimentRepository")
+    @patch("src.routers.experiments.ExperimentService")
+    def test_get_allocation_orders_control_first(
+        self, mock_service, mock_exp_repo, mock_metrics_repo, mock_history_repo, client
+    ):
+        """Control should come first, then variants by allocation descending."""
+        mock_experiment = MagicMock()
+        mock_experiment.status = "active"
+        mock_service.get_experiment.return_value = mock_experiment
+        
+        mock_exp_repo.get_experiment_by_id.return_value = {
+            "id": "exp_123",
+            "name": "test_experiment",
+            "status": "active",
+        }
+        mock_metrics_repo.get_metrics_multi_window.side_effect = _by_window([
+            {
+                "variant_id": f"var_00{i}",
+                "variant_name": name,
+                "is_control": i == 1,
+                "impressions": 10000,
+                "clicks": clicks,
+                "ctr": clicks / 10000,
+                "beta_alpha": clicks + 1,
+                "beta_beta": 10000 - clicks + 99,
+            }
+            for i, name, clicks in (
+                (1, "control", 300), (2, "variant_a", 320), (3, "variant_b", 500)
+            )
+        ])
+
+        response = client.get("/experiments/exp_123/allocation")
+
+        assert response.status_code == 200
+        allocations = response.json()["allocations"]
+        assert [a["variant_name"] for a in allocations] == ["control", "variant_b", "variant_a"]
+
+    @patch("src.services.allocation.log_algorithm")
+    @patch("src.services.allocation.AllocationHistoryRepository")
+    @patch("src.services.allocation.MetricsRepository")
+    @patch("src.services.allocation.ExperimentRepository")
+    @patch("src.routers.experiments.ExperimentService")
+    def test_get_allocation_skips_algorithm_log_when_disabled(
+        self, mock_service, mock_exp_repo, mock_metrics_repo, mock_history_repo,
+        mock_log_algorithm, client
+    ):
+        """No algorithm log record should be built when INFO is disabled."""
+        mock_experiment = MagicMock()
+        mock_experiment.status = "active"
+        mock_service.get_experiment.return_value = mock_experiment
+        mock_exp_repo.get_experiment_by_id.return_value = {
+            "id": "exp_123",
+            "name": "test_experiment",
+            "status": "active",
+        }
+        mock_metrics_repo.get_metrics_multi_window.side_effect = _by_window([])
+
+        with patch("src.services.allocation.logger.isEnabledFor", return_value=False):
+            response = client.get("/experiments/exp_123/allocation")
+
+        assert response.status_code == 200
+        mock_log_algorithm.assert_not_called()
+
+
+class TestAllocationCache:
+    """Tests for allocation caching and ETag revalidation."""
+
+    def _mock_allocation(self, mock_service, mock_exp_repo, mock_metrics_repo):
+        mock_experiment = MagicMock()
+        mock_experiment.status = "active"
+        mock_service.get_experiment.return_value = mock_experiment
+        mock_exp_repo.get_experiment_by_id.return_value = {
+            "id": "exp_123",
+            "name": "test_experiment",
+            "status": "active",
+        }
+        mock_metrics_repo.get_metrics_multi_window.side_effect = _by_window([
+            {
+                "variant_id": f"var_00{i}",
+                "variant_name": name,
+                "is_control": i == 1,
+                "impressions": 20000,
+                "clicks": 600,
+                "ctr": 0.03,
+                "beta_alpha": 601,
+                "beta_beta": 19499,
+            }
+            for i, name in ((1, "control"), (2, "variant_a"))
+        ])
+
+    @patch("src.services.allocation.AllocationHistoryRepository")
+    @patch("src.services.allocation.MetricsRepository")
+    @patch("src.services.allocation.ExperimentRepository")
+    @patch("src.routers.experiments.ExperimentService")
+    def test_repeated_allocation_is_cached(
+        self, mock_service, mock_exp_repo, mock_metrics_repo, mock_history_repo, client
+    ):
+        """A second call the same day should not recompute."""
+        self._mock_allocation(mock_service, mock_exp_repo, mock_metrics_repo)
+
+        first = client.get("/experiments/exp_123/allocation")
+        second = client.get("/experiments/exp_123/allocation")
+
+        assert first.json() == second.json()
+        assert mock_metrics_repo.get_metrics_multi_window.call_count == 1
+        mock_history_repo.save_allocation.assert_called_once()
+
+    @patch("src.services.allocation.AllocationHistoryRepository")
+    @patch("src.services.allocation.MetricsRepository")
+    @patch("src.services.allocation.ExperimentRepository")
+    @patch("src.routers.experiments.ExperimentService")
+    def test_if_none_match_returns_304(
+        self, mock_service, mock_exp_repo, mock_metrics_repo, mock_history_repo, client
+    ):
+        """A matching ETag should short-circuit with 304 Not Modified."""
+        self._mock_allocation(mock_service, mock_exp_repo, mock_metrics_repo)
+
+        first = client.get("/experiments/exp_123/allocation")
+        etag = first.headers["ETag"]
+        second = client.get(
+            "/experiments/exp_123/allocation", headers={"If-None-Match": etag}
+        )
+
+        assert first.status_code == 200
+        assert second.status_code == 304
+        assert second.headers["ETag"] == etag
+        assert second.content == b""
+
+    def test_etag_ignores_server_timezone(self, monkeypatch):
+        """The same result should get the same ETag on hosts in different timezones."""
+        import time
+        from datetime import datetime
+        from types import SimpleNamespace
+        from src.routers.experiments import _allocation_etag
+
+        result = SimpleNamespace(
+            experiment_id="exp_123", window_days=14, computed_at=datetime(2026, 1, 15, 12, 0)
+        )
+        etags = []
+        for tz in ("UTC", "America/Sao_Paulo"):
+            monkeypatch.setenv("TZ", tz)
+            time.tzset()
+            etags.append(_allocation_etag(result))
+        monkeypatch.undo()
+        time.tzset()
+
+        assert etags[0] == etags[1]
+
+    @patch("src.services.allocation.AllocationHistoryRepository")
+    @patch("src.services.allocation.MetricsRepository")
+    @patch("src.services.allocation.ExperimentRepository")
+    @patch("src.routers.experiments.ExperimentService")
+    def test_recording_metrics_invalidates(
+        self, mock_service, mock_exp_repo, mock_metrics_repo, mock_history_repo, client
+    ):
+        """New metrics should force the next allocation to recompute."""
+        from src.services.allocation import invalidate_allocation_cache
+        self._mock_allocation(mock_service, mock_exp_repo, mock_metrics_repo)
+
+        client.get("/experiments/exp_123/allocation")
+        invalidate_allocation_cache("exp_123")
+        client.get("/experiments/exp_123/allocation")
+
+        assert mock_metrics_repo.get_metrics_multi_window.call_count == 2
+
+    @patch("src.services.experiment.invalidate_allocation_cache")
+    @patch("src.services.experiment.MetricsRepository")
+    @patch("src.services.experiment.ExperimentRepository")
+    def test_record_metrics_calls_invalidation(
+        self, mock_exp_repo, mock_metrics_repo, mock_invalidate, client, sample_metrics_data
+    ):
+        """Recording metrics should invalidate that experiment's allocations."""
+        mock_exp_repo.get_experiment_by_id.return_value = {
+            "id": "exp_123",
+            "variants": [
+                {"id": "var_001", "name": "control"},
+                {"id": "var_002", "name": "variant_a"},
+            ],
+        }
+
+        response = client.post("/experiments/exp_123/metrics", json=sample_metrics_data)
+
+        assert response.status_code == 201
+        mock_invalidate.assert_called_once_with("exp_123")
+
+
+class TestBatchAllocationEndpoint:
+    """Tests for the multi-experiment allocation endpoint."""
+
+    def _metrics(self, impressions):
+        return [
+            {
+                "variant_id": "var_001",
+                "variant_name": "control",
+                "is_control": True,
+                "impressions": impressions,
+                "clicks": impressions // 30,
+                "ctr": 0.033,
+                "beta_alpha": 1 + impressions // 30,
+                "beta_beta": 99 + impressions - impressions // 30,
+            },
+            {
+                "variant_id": "var_002",
+                "variant_name": "variant_a",
+                "is_control": False,
+                "impressions": impressions,
+                "clicks": impressions // 20,
+                "ctr": 0.05,
+                "beta_alpha": 1 + impressions // 20,
+                "beta_beta": 99 + impressions - impressions // 20,
+            },
+        ]
+
+    @patch("src.services.allocation.AllocationHistoryRepository")
+    @patch("src.services.allocation.MetricsRepository")
+    @patch("src.services.allocation.ExperimentRepository")
+    @patch("src.routers.experiments.ExperimentService")
+    def test_get_allocations_batches_metric_reads(
+        self, mock_service, mock_exp_repo, mock_metrics_repo, mock_history_repo, client
+    ):
+        """Should read metrics for all experiments in one query per window."""
+        mock_experiment = MagicMock()
+        mock_experiment.status = "active"
+        mock_service.get_experiment.return_value = mock_experiment
+        mock_exp_repo.get_experiment_by_id.side_effect = lambda experiment_id: {
+            "id": experiment_id,
+            "name": f"name_{experiment_id}",
+            "status": "active",
+        }
+        # exp_2 is under-sampled in the default window and gets expanded
+        mock_metrics_repo.get_metrics_for_allocation_many.side_effect = [
+            {"exp_1": self._metrics(20000), "exp_2": self._metrics(50)},
+            {"exp_2": self._metrics(20000)},
+        ]
+
+        response = client.get(
+            "/experiments/allocations",
+            params=[("experiment_ids", "exp_1"), ("experiment_ids", "exp_2")],
+        )
+
+        assert response.status_code == 200
+        experiments = response.json()["experiments"]
+        assert [e["experiment_id"] for e in experiments] == ["exp_1", "exp_2"]
+        assert experiments[0]["window_days"] == 14
+        assert experiments[1]["window_days"] == 30
+        for experiment in experiments:
+            total = sum(a["allocation_percentage"] for a in experiment["allocations"])
+            assert abs(total - 100.0) < 0.1
+        
+        calls = mock_metrics_repo.get_metrics_for_allocation_many.call_args_list
+        assert calls[0].args == (["exp_1", "exp_2"], 14)
+        assert calls[1].args == (["exp_2"], 30)
+        mock_metrics_repo.get_metrics_for_allocation.assert_not_called()
+
+    @patch("src.routers.experiments.ExperimentService")
+    def test_get_allocations_unknown_experiment(self, mock_service, client):
+        """Should return 404 naming the missing experiment."""
+        mock_service.get_experiment.return_value = None
+
+        response = client.get("/experiments/allocations?experiment_ids=missing")
+
+        assert response.status_code == 404
+        assert "missing" in response.json()["detail"]
+
+    def test_get_allocations_requires_ids(self, client):
+        """Should reject requests without experiment IDs."""
+        response = client.get("/experiments/allocations")
+
+        assert response.status_code == 422
+
+    @patch("src.services.allocation.AllocationHistoryRepository")
+    @patch("src.services.allocation.MetricsRepository")
+    @patch("src.services.allocation.ExperimentRepository")
+    @patch("src.routers.experiments.ExperimentService")
+    def test_refresh_warms_cache_for_requests(
+        self, mock_service, mock_exp_repo, mock_metrics_repo, mock_history_repo, client
+    ):
+        """Background refresh should always recompute, and requests read its result."""
+        from src.services.allocation import AllocationService
+        mock_experiment = MagicMock()
+        mock_experiment.status = "active"
+        mock_service.get_experiment.return_value = mock_experiment
+        mock_exp_repo.get_active_experiment_ids.return_value = ["exp_1"]
+        mock_exp_repo.get_experiment_by_id.return_value = {
+            "id": "exp_1",
+            "name": "name_exp_1",
+            "status": "active",
+        }
+        mock_metrics_repo.get_metrics_for_allocation_many.return_value = {
+            "exp_1": self._metrics(20000)
+        }
+
+        service = AllocationService()
+        assert service.refresh_allocations() == 1
+        assert service.refresh_allocations() == 1
+        mock_history_repo.save_allocation.assert_not_called()
+        
+        response = client.get("/experiments/exp_1/allocation")
+        client.get("/experiments/exp_1/allocation")
+
+        assert response.status_code == 200
+        assert mock_metrics_repo.get_metrics_for_allocation_many.call_count == 2
+        mock_metrics_repo.get_metrics_multi_window.assert_not_called()
+        # The served result is recorded once, on its first request
+        mock_history_repo.save_allocation.assert_called_once()
+
+    @patch("src.services.allocation.AllocationHistoryRepository")
+    @patch("src.services.allocation.MetricsRepository")
+    @patch("src.services.allocation.ExperimentRepository")
+    @patch("src.routers.experiments.ExperimentService")
+    def test_unchanged_refresh_keeps_etag_and_history(
+        self, mock_service, mock_exp_repo, mock_metrics_repo, mock_history_repo, client
+    ):
+        """Refreshing unchanged inputs should not change the ETag or add history rows."""
+        from src.services.allocation import AllocationService
+        mock_experiment = MagicMock()
+        mock_experiment.status = "active"
+        mock_service.get_experiment.return_value = mock_experiment
+        mock_exp_repo.get_active_experiment_ids.return_value = ["exp_1"]
+        mock_exp_repo.get_experiment_by_id.return_value = {
+            "id": "exp_1",
+            "name": "name_exp_1",
+            "status": "active",
+        }
+        mock_metrics_repo.get_metrics_for_allocation_many.return_value = {
+            "exp_1": self._metrics(20000)
+        }
+
+        service = AllocationService()
+        service.refresh_allocations()
+        first = client.get("/experiments/exp_1/allocation")
+        service.refresh_allocations()
+        second = client.get(
+            "/experiments/exp_1/allocation",
+            headers={"If-None-Match": first.headers["ETag"]},
+        )
+
+        assert second.status_code == 304
+        mock_history_repo.save_allocation.assert_called_once()
+
+    @patch("src.services.allocation.REFRESH_BATCH_SIZE", 2)
+    @patch("src.services.allocation.ExperimentRepository")
+    @patch("src.services.allocation.AllocationService.get_allocations")
+    def test_refresh_queries_in_batches(self, mock_get_allocations, mock_exp_repo):
+        """Refresh should split active experiments into bounded batches."""
+        from src.services.allocation import AllocationService
+        mock_exp_repo.get_active_experiment_ids.return_value = ["exp_1", "exp_2", "exp_3"]
+        mock_get_allocations.side_effect = lambda ids, **kwargs: [MagicMock() for _ in ids]
+
+        assert AllocationService().refresh_allocations() == 3
+        batches = [c.args[0] for c in mock_get_allocations.call_args_list]
+        assert batches == [["exp_1", "exp_2"], ["exp_3"]]
+
+
+class TestHistoryEndpoint:
+    """Tests for history endpoint."""
+
+    def _experiment(self):
+        return {
+            "id": "exp_123",
+            "name": "test_experiment",
+            "description": None,
+            "status": "active",
+            "variants": [
+                {"id": "var_001", "name": "control", "is_control": True, "created_at": utc_now()},
+            ],
+            "created_at": utc_now(),
+            "updated_at": utc_now(),
+        }
+
+    @patch("src.services.experiment.ExperimentRepository")
+    @patch("src.repositories.metrics.MetricsRepository.stream_experiment_history")
+    def test_get_history_success(self, mock_history, mock_exp_repo, client):
+        """Should stream history with CTR intervals from one repository call."""
+        mock_exp_repo.get_experiment_by_id.return_value = self._experiment()
+        mock_history.return_value = (
+            "test_experiment",
+            iter([
+                {
+                    "metric_date": date(2025, 1, 15),
+                    "variant_id": "var_001",
+                    "variant_name": "control",
+                    "is_control": True,
+                    "impressions": 1000,
+                    "clicks": 30,
+                    "ctr": Decimal("0.030000"),
+                },
+                {
+                    "metric_date": date(2025, 1, 15),
+                    "variant_id": "var_002",
+                    "variant_name": "variant_a",
+                    "is_control": False,
+                    "impressions": 0,
+                    "clicks": 0,
+                    "ctr": Decimal("0"),
+                },
+            ]),
+        )
+
+        response = client.get("/experiments/exp_123/history")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["experiment_id"] == "exp_123"
+        assert data["experiment_name"] == "test_experiment"
+        assert len(data["history"]) == 2
+        assert data["history"][0]["metric_date"] == "2025-01-15"
+        assert data["history"][0]["ctr"] == 0.03
+        assert data["history"][0]["ctr_ci"] is not None
+        assert data["history"][1]["ctr_ci"] is None
+        mock_history.assert_called_once_with("exp_123", start_date=None, end_date=None)
+
+    @patch("src.services.experiment.ExperimentRepository")
+    @patch("src.repositories.metrics.MetricsRepository.stream_experiment_history")
+    def test_get_history_date_range(self, mock_history, mock_exp_repo, client):
+        """Date bounds should reach the query and get their own ETag."""
+        mock_exp_repo.get_experiment_by_id.return_value = self._experiment()
+        mock_history.side_effect = lambda *args, **kwargs: ("test_experiment", iter([]))
+
+        full = client.get("/experiments/exp_123/history")
+        ranged = client.get(
+            "/experiments/exp_123/history",
+            params={"start_date": "2025-01-01", "end_date": "2025-01-31"},
+        )
+
+        assert ranged.status_code == 200
+        assert ranged.headers["ETag"] != full.headers["ETag"]
+        mock_history.assert_called_with(
+            "exp_123", start_date=date(2025, 1, 1), end_date=date(2025, 1, 31)
+        )
+
+    @patch("src.services.experiment.ExperimentRepository")
+    @patch("src.repositories.metrics.MetricsRepository.stream_experiment_history")
+    def test_get_history_not_found(self, mock_history, mock_exp_repo, client):
+        """Should return 404 for non-existent experiment."""
+        mock_exp_repo.get_experiment_by_id.return_value = None
+
+        response = client.get("/experiments/nonexistent/history")
+
+        assert response.status_code == 404
+        mock_history.assert_not_called()
+
+    @patch("src.services.experiment.ExperimentRepository")
+    @patch("src.repositories.metrics.MetricsRepository.stream_experiment_history")
+    def test_matching_etag_skips_history_query(self, mock_history, mock_exp_repo, client):
+        """A matching If-None-Match should return 304 without querying history."""
+        mock_exp_repo.get_experiment_by_id.return_value = self._experiment()
+        mock_history.return_value = ("test_experiment", iter([]))
+
+        first = client.get("/experiments/exp_123/history")
+        second = client.get(
+            "/experiments/exp_123/history",
+            headers={"If-None-Match": first.headers["ETag"]},
+        )
+
+        assert second.status_code == 304
+        assert mock_history.call_count == 1
@@ -106,38 +106,55 @@ class TestThompsonSamplingEngine:
         assert allocations["control"] == 50.0
         assert allocations["variant_a"] == 50.0
 
+    def test_identical_posteriors_skip_sampling(self, sample_variant_data):
+        """Variants at the same posterior should split traffic evenly without sampling."""
+        from dataclasses import replace
+        from unittest.mock import patch
+
+        variants = [
+            replace(sample_variant_data[0], variant_name=name)
+            for name in ("control", "variant_a", "variant_b")
+        ]
+        with patch.object(self.engine, "_count_wins") as mock_wins:
+            allocations = self.engine.calculate_allocation(variants, seed=1)
+
+        mock_wins.assert_not_called()
+        assert allocations == {"control": 33.34, "variant_a": 33.33, "variant_b": 33.33}
+
     def test_allocation_with_three_variants(self):
         """Should work with more than 2 variants (multi-armed bandit)."""
+        # 1000 impressions keep the posteriors overlapping, so even the
+        # worst variant still wins some draws and the ordering is measurable
         variants = [
             VariantData(
                 variant_id="var_001",
                 variant_name="control",
                 is_control=True,
-                impressions=10000,
-                clicks=200,  # 2% CTR
+                impressions=1000,
+                clicks=20,  # 2% CTR
                 ctr=0.02,
-                beta_alpha=201,
-                beta_beta=9801,
+                beta_alpha=21,
+                beta_beta=981,
             ),
             VariantData(
                 variant_id="var_002",
                 variant_name="variant_a",
                 is_control=False,
-                impressions=10000,
-                clicks=400,  # 4% CTR
+                impressions=1000,
+                clicks=40,  # 4% CTR
                 ctr=0.04,
-                beta_alpha=401,
-                beta_beta=9601,
+                beta_alpha=41,
+                beta_beta=961,
             ),
             VariantData(
                 variant_id="var_003",
                 variant_name="variant_b",
                 is_control=False,
-                impressions=10000,
-                clicks=300,  # 3% CTR
+                impressions=1000,
+                clicks=30,  # 3% CTR
                 ctr=0.03,
-                beta_alpha=301,
-                beta_beta=9701,
+                beta_alpha=31,
+                beta_beta=971,
             ),
         ]
 
@@ -153,6 +170,32 @@ class TestThompsonSamplingEngine:
         allocations = self.engine.calculate_allocation([])
         assert allocations == {}
 
+    def test_exact_probability_matches_known_values(self):
+        """Closed form should match symmetric and hand-computed cases."""
+        from src.services.allocation import probability_b_beats_a
+
+        # Identical posteriors: a coin flip
+        assert probability_b_beats_a(301, 9701, 301, 9701) == pytest.approx(0.5)
+        # Beta(2, 1) vs Beta(1, 1): P(U > X) with X ~ max of two uniforms = 1/3
+        assert probability_b_beats_a(2, 1, 1, 1) == pytest.approx(1 / 3)
+        assert probability_b_beats_a(1, 1, 2, 1) == pytest.approx(2 / 3)
+
+    def test_allocate_works_on_parallel_arrays(self):
+        """The array API should return percentages aligned with its inputs."""
+        import numpy as np
+
+        percentages = self.engine.allocate(
+            impressions=np.array([1000, 1000, 1000]),
+            alphas=np.array([21.0, 41.0, 31.0]),
+            betas=np.array([981.0, 961.0, 971.0]),
+            seed=3,
+        )
+
+        assert percentages.shape == (3,)
+        assert percentages.argmax() == 1
+        assert percentages.sum() == pytest.approx(100)
+        assert self.engine.allocate(np.array([]), np.array([]), np.array([]), seed=3).size == 0
+
     def test_beta_parameters_calculation(self):
         """Verify beta parameters are correctly used."""
         # Beta(101, 9901) = 100 clicks, 10000 impressions
@@ -178,6 +221,301 @@ class TestThompsonSamplingEngine:
         total = sum(allocations.values())
         assert total == pytest.approx(100, abs=0.1)
 
+    def test_same_seed_same_allocation(self, sample_variant_data):
+        """A fixed seed should reproduce the allocation exactly."""
+        first = self.engine.calculate_allocation(sample_variant_data, seed=42)
+        second = self.engine.calculate_allocation(sample_variant_data, seed=42)
+
+        assert first == second
+
+    def test_seeded_allocation_is_memoized(self, sample_variant_data):
+        """Unchanged posteriors with the same seed should not be sampled again."""
+        from dataclasses import replace
+        from unittest.mock import patch
+
+        variants = sample_variant_data + [
+            replace(sample_variant_data[1], variant_id="var_003", variant_name="variant_b"),
+        ]
+        with patch.object(self.engine, "_count_wins", wraps=self.engine._count_wins) as spy:
+            first = self.engine.calculate_allocation(variants, seed=7)
+            second = self.engine.calculate_allocation(variants, seed=7)
+            self.engine.calculate_allocation(variants, seed=8)
+
+        assert first == second
+        assert spy.call_count == 2
+
+    def test_unseeded_calls_reuse_the_engine_generator(self, sample_variant_data):
+        """Without a seed, no new generator should be created per call."""
+        from dataclasses import replace
+        from unittest.mock import patch
+
+        variants = sample_variant_data + [
+            replace(sample_variant_data[1], variant_id="var_003", variant_name="variant_b"),
+        ]
+        with patch("src.services.allocation.np.random.default_rng") as mock_rng:
+            self.engine.calculate_allocation(variants)
+
+        mock_rng.assert_not_called()
+
+    def test_wins_are_counted_per_row(self, sample_variant_data):
+        """Each sample row should count one win for its highest column."""
+        import numpy as np
+        from dataclasses import replace
+        from unittest.mock import patch
+
+        variants = sample_variant_data + [
+            replace(sample_variant_data[1], variant_id="var_003", variant_name="variant_b"),
+        ]
+        engine = ThompsonSamplingEngine(n_samples=4)
+        samples = np.array([
+            [0.1, 0.2, 0.0],
+            [0.3, 0.2, 0.1],
+            [0.1, 0.4, 0.5],
+            [0.05, 0.06, 0.01],
+        ])
+        with patch.object(engine, "_sample_ctr", return_value=samples):
+            allocations = engine.calculate_allocation(variants, seed=1)
+
+        assert allocations == {"control": 25.0, "variant_a": 50.0, "variant_b": 25.0}
+
+    def test_wins_are_counted_across_blocks(self, sample_variant_data):
+        """Sampling in blocks should still count every simulation once."""
+        import numpy as np
+        from unittest.mock import patch
+
+        engine = ThompsonSamplingEngine(n_samples=2500)
+        with patch("src.services.allocation.SAMPLE_BLOCK_ROWS", 300), \
+                patch("src.services.allocation.EARLY_STOP_HALF_WIDTH", 0.0):
+            alphas, betas = engine._beta_params(sample_variant_data)
+            wins = engine._count_wins(alphas, betas, np.random.default_rng(0))
+
+        assert wins.sum() == 2500
+        assert wins[1] > wins[0]
+
+    def test_unanimous_leader_stops_early(self):
+        """A variant winning every draw should stop after the first stage."""
+        import numpy as np
+
+        engine = ThompsonSamplingEngine(n_samples=10000)
+        alphas = np.array([321.0, 451.0, 300.0])
+        betas = np.array([9779.0, 9649.0, 9800.0])
+
+        wins = engine._count_wins(alphas, betas, np.random.default_rng(0))
+
+        assert wins.sum() == 1000
+        assert wins[1] == 1000
+
+    def test_close_variants_use_all_samples(self):
+        """Without a clear leader every configured simulation should run."""
+        import numpy as np
+
+        engine = ThompsonSamplingEngine(n_samples=10000)
+        alphas = np.array([321.0, 322.0, 323.0])
+        betas = np.array([9779.0, 9778.0, 9777.0])
+
+        wins = engine._count_wins(alphas, betas, np.random.default_rng(0))
+
+        assert wins.sum() == 10000
+
+    def test_parallel_blocks_match_inline_blocks(self, sample_variant_data):
+        """Running blocks on worker threads should not change the result."""
+        import numpy as np
+        from concurrent.futures import ThreadPoolExecutor
+        from unittest.mock import patch
+
+        engine = ThompsonSamplingEngine(n_samples=2500)
+        alphas, betas = engine._beta_params(sample_variant_data)
+        with patch("src.services.allocation.SAMPLE_BLOCK_ROWS", 300), \
+                patch("src.services.allocation.EARLY_STOP_HALF_WIDTH", 0.0):
+            inline = engine._count_wins(alphas, betas, np.random.default_rng(0))
+            with ThreadPoolExecutor(max_workers=2) as pool, \
+                    patch("src.services.allocation._sampling_pool", pool):
+                parallel = engine._count_wins(alphas, betas, np.random.default_rng(0))
+
+        np.testing.assert_array_equal(inline, parallel)
+
+    def test_rounding_residual_goes_to_largest_allocation(self, sample_variant_data):
+        """Percentages that don't round to 100 should be fixed on the largest one."""
+        import numpy as np
+        from dataclasses import replace
+        from unittest.mock import patch
+
+        variants = sample_variant_data + [
+            replace(sample_variant_data[1], variant_id="var_003", variant_name="variant_b"),
+        ]
+        engine = ThompsonSamplingEngine(n_samples=3)
+        with patch.object(engine, "_count_wins", return_value=np.array([1, 1, 1])):
+            allocations = engine.calculate_allocation(variants, seed=1)
+
+        assert allocations == {"control": 33.34, "variant_a": 33.33, "variant_b": 33.33}
+
+    def test_two_arms_use_exact_probability(self, sample_variant_data):
+        """Two arms should be allocated without sampling."""
+        from unittest.mock import patch
+
+        with patch.object(self.engine, "_sample_ctr") as mock_sample:
+            allocations = self.engine.calculate_allocation(sample_variant_data, seed=1)
+
+        mock_sample.assert_not_called()
+        assert allocations["variant_a"] > 99
+        assert sum(allocations.values()) == pytest.approx(100, abs=0.001)
+
+    def test_two_arms_fall_back_to_sampling_for_huge_alpha(self, sample_variant_data):
+        """A series longer than the cap should go back to Monte Carlo."""
+        from unittest.mock import patch
+
+        with patch("src.services.allocation.EXACT_TWO_ARM_MAX_TERMS", 100):
+            allocations = self.engine.calculate_allocation(sample_variant_data, seed=1)
+
+        assert allocations["variant_a"] > 99
+
+    def test_samples_have_one_column_per_variant(self, sample_variant_data):
+        """Samples should come back as an (n_samples, n_variants) matrix."""
+        import numpy as np
+
+        alphas, betas = self.engine._beta_params(sample_variant_data)
+        samples = self.engine._sample_ctr(alphas, betas, np.random.default_rng(0))
+
+        assert samples.shape == (10000, 2)
+        assert samples.dtype == np.float32
+        # Column order follows the variant order (control ~3.2%, variant_a ~4.5%)
+        assert samples[:, 0].mean() == pytest.approx(0.032, abs=0.002)
+        assert samples[:, 1].mean() == pytest.approx(0.045, abs=0.002)
+
+    def test_dominant_variant_skips_sampling(self, sample_variant_data):
+        """A variant whose interval is above all others should take 100%."""
+        from dataclasses import replace
+        from unittest.mock import patch
+
+        winner = replace(
+            sample_variant_data[1], variant_id="var_003", variant_name="variant_b",
+            clicks=900, beta_alpha=901, beta_beta=9101,
+        )
+        variants = sample_variant_data + [winner]
+
+        with patch.object(self.engine, "_sample_ctr") as mock_sample:
+            allocations = self.engine.calculate_allocation(variants, seed=1)
+
+        mock_sample.assert_not_called()
+        assert allocations == {"control": 0.0, "variant_a": 0.0, "variant_b": 100.0}
+
+    def test_small_posteriors_are_never_short_circuited(self):
+        """Below the normal-approximation threshold the check should not apply."""
+        variants = [
+            VariantData("var_001", "control", True, 100, 1, 0.01, 2, 198),
+            VariantData("var_002", "variant_a", False, 100, 90, 0.9, 91, 109),
+        ]
+
+        alphas, betas = ThompsonSamplingEngine._beta_params(variants)
+        assert ThompsonSamplingEngine._dominant_index(alphas, betas) is None
+
+    def test_one_skewed_posterior_keeps_every_arm_exact(self, sample_variant_data):
+        """A posterior with a small α or β should switch all arms to Beta sampling."""
+        import numpy as np
+        from dataclasses import replace
+        from unittest.mock import MagicMock
+
+        # Beta(11, 1090): α + β is large but the posterior is still skewed
+        skewed = replace(
+            sample_variant_data[0], variant_name="skewed",
+            impressions=1099, clicks=10, beta_alpha=11, beta_beta=1090,
+        )
+        variants = [sample_variant_data[0], skewed, sample_variant_data[1]]
+
+        alphas, betas = self.engine._beta_params(variants)
+        rng = MagicMock(wraps=np.random.default_rng(0))
+        samples = self.engine._sample_ctr(alphas, betas, rng)
+
+        rng.standard_normal.assert_not_called()
+        assert samples.shape == (10000, 3)
+        assert samples[:, 0].mean() == pytest.approx(321 / 10002, abs=0.001)
+        assert samples[:, 1].mean() == pytest.approx(11 / 1101, abs=0.001)
+        assert samples[:, 2].mean() == pytest.approx(451 / 10002, abs=0.001)
+        assert samples.min() >= 0.0 and samples.max() <= 1.0
+
+    def test_symmetric_posteriors_use_normal_approximation(self, sample_variant_data):
+        """With min(α, β) above the threshold for every arm, all draws are normal."""
+        import numpy as np
+        from unittest.mock import MagicMock
+
+        alphas, betas = self.engine._beta_params(sample_variant_data)
+        rng = MagicMock(wraps=np.random.default_rng(0))
+        samples = self.engine._sample_ctr(alphas, betas, rng)
+
+        rng.standard_gamma.assert_not_called()
+        assert samples[:, 0].mean() == pytest.approx(321 / 10002, abs=0.001)
+
+
+class TestWilsonScoreIntervals:
+    """Tests for the vectorized Wilson score interval."""
+
+    def test_matches_scalar_version(self):
+        """Array results should equal per-variant scalar calls, None for no data."""
+        import numpy as np
+        from src.services.allocation import wilson_score_interval, wilson_score_intervals
+
+        clicks = np.array([320, 0, 7, 1000, 0])
+        impressions = np.array([10000, 500, 7, 1000, 0])
+
+        intervals = wilson_score_intervals(clicks, impressions)
+
+        assert intervals == [
+            wilson_score_interval(c, n) for c, n in zip(clicks.tolist(), impressions.tolist())
+        ]
+        assert intervals[-1] is None
+
+
+class TestAllocationCache:
+    """Tests for the per-experiment allocation cache."""
+
+    def test_pending_history_is_saved_once(self):
+        """A request arriving while another saves the pending record must not save it again."""
+        from datetime import date
+        from unittest.mock import patch
+        from src.services import allocation
+
+        day = date(2026, 1, 15)
+        result = object()
+        allocation._cache_allocation("exp_1", 14, day, result, {"seed": 1})
+        saves = []
+
+        def save(experiment_id, record):
+            saves.append(record)
+            # Concurrent request while the first one is writing
+            assert allocation._get_cached_allocation("exp_1", 14, day, True) is result
+
+        with patch("src.services.allocation._save_history", side_effect=save):
+            assert allocation._get_cached_allocation("exp_1", 14, day, True) is result
+            assert allocation._get_cached_allocation("exp_1", 14, day, True) is result
+
+        assert saves == [{"seed": 1}]
+
+    def test_writes_extend_expiry(self):
+        """Each write should restart the experiment's TTL, not mutate an expiring entry."""
+        from datetime import date
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from src.services import allocation
+
+        day = date(2026, 1, 15)
+        first = SimpleNamespace(window_days=14, algorithm="thompson_sampling", allocations=[1])
+        second = SimpleNamespace(window_days=14, algorithm="thompson_sampling", allocations=[2])
+        with patch("src.cache.time.monotonic", return_value=1000.0):
+            allocation._cache_allocation("exp_1", 14, day, first, None)
+        with patch("src.cache.time.monotonic", return_value=1050.0):
+            allocation._cache_allocation("exp_1", 14, day, second, None)
+        ttl = allocation._allocation_cache.ttl
+        with patch("src.cache.time.monotonic", return_value=1000.0 + ttl + 1):
+            assert allocation._get_cached_allocation("exp_1", 14, day, False) is second
+
+    def test_refresh_interval_must_be_below_cache_ttl(self):
+        """A refresh slower than the cache TTL would leave cold gaps."""
+        from src.config import Settings
+
+        with pytest.raises(ValueError, match="allocation_refresh_interval"):
+            Settings(allocation_cache_ttl=60, allocation_refresh_interval=60)
+        assert Settings(allocation_cache_ttl=60, allocation_refresh_interval=30)
+
 
 class TestValidation:
     """Tests for input validation."""
@@ -0,0 +1,62 @@
+"""Tests for the in-process TTL cache."""
+
+from unittest.mock import patch
+
+from src.cache import TTLCache
+
+
+class TestTTLCache:
+    """Tests for TTLCache."""
+
+    def test_returns_cached_value(self):
+        """Stored values should be returned until they expire."""
+        cache = TTLCache(maxsize=10, ttl=30)
+        cache.set("key", {"value": 1})
+        
+        assert cache.get("key") == {"value": 1}
+
+    def test_missing_key_returns_default(self):
+        """Missing keys should return the default."""
+        cache = TTLCache()
+        
+        assert cache.get("missing") is None
+        assert cache.get("missing", "fallback") == "fallback"
+
+    def test_entries_expire_after_ttl(self):
+        """Entries older than the TTL should be dropped."""
+        cache = TTLCache(maxsize=10, ttl=30)
+        
+        with patch("src.cache.time.monotonic", return_value=1000.0):
+            cache.set("key", "value")
+        with patch("src.cache.time.monotonic", return_value=1029.0):
+            assert cache.get("key") == "value"
+        with patch("src.cache.time.monotonic", return_value=1031.0):
+            assert cache.get("key") is None
+        
+        assert len(cache) == 0
+
+    def test_evicts_least_recently_used(self):
+        """When full, the least recently used entry should be evicted."""
+        cache = TTLCache(maxsize=2, ttl=30)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now the least recently used
+        cache.set("c", 3)
+        
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_pop_and_clear(self):
+        """pop and clear should invalidate entries."""
+        cache = TTLCache()
+        cache.set("a", 1)
+        cache.set("b", 2)
+        
+        cache.pop("a")
+        cache.pop("missing")
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+        
+        cache.clear()
+        assert len(cache) == 0
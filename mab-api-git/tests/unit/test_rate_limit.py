@@ -5,7 +5,7 @@ from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
 
 from src.main import app
-from src.rate_limit import rate_limiter, RateLimiter
+from src.rate_limit import rate_limiter, RateLimiter, SlidingLogRateLimiter
 
 
 # UUID válido para testes - será reconhecido pelo get_endpoint_pattern
@@ -53,6 +53,84 @@ class TestRateLimiter:
         allowed_b, _, _ = limiter.is_allowed("key_b", max_requests=3, window_seconds=60)
         assert allowed_b is True
 
+    def test_same_key_is_limited_per_endpoint(self):
+        """The same client should have independent limits per endpoint."""
+        limiter = RateLimiter()
+        
+        for _ in range(3):
+            limiter.is_allowed("client", max_requests=3, window_seconds=60, endpoint="GET /a")
+        
+        assert limiter.is_allowed("client", max_requests=3, window_seconds=60, endpoint="GET /a")[0] is False
+        assert limiter.is_allowed("client", max_requests=3, window_seconds=60, endpoint="GET /b")[0] is True
+
+    def test_previous_window_is_weighted_by_overlap(self):
+        """Requests from the previous window should count proportionally."""
+        limiter = RateLimiter()
+        
+        with patch("src.rate_limit.time.monotonic", return_value=1000.0):
+            for _ in range(10):
+                limiter.is_allowed("key_w", max_requests=10, window_seconds=60)
+        
+        # 45s into the next window: 10 * (1 - 45/60) = 2.5 still count
+        with patch("src.rate_limit.time.monotonic", return_value=1105.0):
+            results = [
+                limiter.is_allowed("key_w", max_requests=10, window_seconds=60)[0]
+                for _ in range(9)
+            ]
+        
+        assert results == [True] * 8 + [False]
+
+    def test_idle_key_is_fully_reset(self):
+        """After two full windows without traffic, the limit should reset."""
+        limiter = RateLimiter()
+        
+        with patch("src.rate_limit.time.monotonic", return_value=1000.0):
+            for _ in range(5):
+                limiter.is_allowed("key_idle", max_requests=5, window_seconds=60)
+            assert limiter.is_allowed("key_idle", max_requests=5, window_seconds=60)[0] is False
+        
+        with patch("src.rate_limit.time.monotonic", return_value=1130.0):
+            allowed, remaining, _ = limiter.is_allowed("key_idle", max_requests=5, window_seconds=60)
+        
+        assert allowed is True
+        assert remaining == 4
+
+
+class TestSlidingLogRateLimiter:
+    """Unit tests for the exact SlidingLogRateLimiter."""
+
+    def test_blocks_requests_over_limit(self):
+        """Should block requests over the limit."""
+        limiter = SlidingLogRateLimiter()
+        
+        for i in range(5):
+            allowed, remaining, _ = limiter.is_allowed("key", max_requests=5, window_seconds=60)
+            assert allowed is True
+            assert remaining == 5 - i - 1
+        
+        allowed, remaining, _ = limiter.is_allowed("key", max_requests=5, window_seconds=60)
+        assert allowed is False
+        assert remaining == 0
+
+    def test_requests_expire_after_window(self):
+        """Requests older than the window should no longer count."""
+        limiter = SlidingLogRateLimiter()
+        epoch = limiter._epoch
+        
+        with patch("src.rate_limit.time.monotonic", return_value=epoch + 10):
+            for _ in range(3):
+                limiter.is_allowed("key", max_requests=3, window_seconds=60)
+        with patch("src.rate_limit.time.monotonic", return_value=epoch + 40):
+            allowed, _, reset = limiter.is_allowed("key", max_requests=3, window_seconds=60)
+            assert allowed is False
+            assert reset == 30
+        with patch("src.rate_limit.time.monotonic", return_value=epoch + 71):
+            allowed, remaining, _ = limiter.is_allowed("key", max_requests=3, window_seconds=60)
+        
+        assert allowed is True
+        assert remaining == 2
+        assert len(limiter._requests[""]["key"]) == 1
+
 
 class TestRateLimitMiddleware:
     """Integration tests for rate limit middleware."""
@@ -96,9 +174,11 @@ class TestRateLimitMiddleware:
                 
                 # A chave correta usa "testclient" (o IP do TestClient)
                 # e o pattern normalizado do endpoint (com UUID → {experiment_id})
-                test_key = "testclient:GET /experiments/{experiment_id}"
                 for _ in range(120):
-                    rate_limit.rate_limiter.is_allowed(test_key, max_requests=120, window_seconds=60)
+                    rate_limit.rate_limiter.is_allowed(
+                        "testclient", max_requests=120, window_seconds=60,
+                        endpoint="GET /experiments/{experiment_id}",
+                    )
                 
                 # This request should be rate limited (usando UUID válido)
                 response = client.get(f"/experiments/{TEST_EXPERIMENT_ID}")
@@ -120,9 +200,11 @@ class TestRateLimitMiddleware:
                 mock_repo.get_experiment_by_id.return_value = None
                 
                 # A chave correta usa "testclient" (o IP do TestClient)
-                test_key = "testclient:GET /experiments/{experiment_id}"
                 for _ in range(120):
-                    rate_limit.rate_limiter.is_allowed(test_key, max_requests=120, window_seconds=60)
+                    rate_limit.rate_limiter.is_allowed(
+                        "testclient", max_requests=120, window_seconds=60,
+                        endpoint="GET /experiments/{experiment_id}",
+                    )
                 
                 # This request should be rate limited (usando UUID válido)
                 response = client.get(f"/experiments/{TEST_EXPERIMENT_ID}")
@@ -135,6 +217,44 @@ class TestRateLimitMiddleware:
         finally:
             rate_limit.rate_limiter = original_limiter
 
+    def test_rejection_logging_is_sampled(self, client):
+        """Repeated rejections for the same key should be logged once per sample."""
+        from src import rate_limit
+        original_limiter = rate_limit.rate_limiter
+        rate_limit.rate_limiter = RateLimiter()
+        rate_limit._rejection_counts.clear()
+        
+        try:
+            for _ in range(120):
+                rate_limit.rate_limiter.is_allowed(
+                    "testclient", max_requests=120, window_seconds=60,
+                    endpoint="GET /experiments/{experiment_id}",
+                )
+            
+            with patch.object(rate_limit.logger, "warning") as mock_warning:
+                for _ in range(5):
+                    response = client.get(f"/experiments/{TEST_EXPERIMENT_ID}")
+                    assert response.status_code == 429
+            
+            mock_warning.assert_called_once()
+            assert mock_warning.call_args[1]["extra"]["rejections"] == 1
+        finally:
+            rate_limit.rate_limiter = original_limiter
+            rate_limit._rejection_counts.clear()
+
+    def test_rejection_counts_are_bounded(self):
+        """Rotating client keys should not grow the rejection counters forever."""
+        from src import rate_limit
+        counts = rate_limit._rejection_counts
+        
+        try:
+            assert counts.ttl == 60
+            for i in range(counts.maxsize + 10):
+                counts.set(("GET /experiments/{experiment_id}", f"10.0.{i}"), 1)
+            assert len(counts) == counts.maxsize
+        finally:
+            counts.clear()
+
 
 class TestRateLimitConfiguration:
     """Tests for rate limit configuration."""
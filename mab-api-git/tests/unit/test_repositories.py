@@ -0,0 +1,650 @@
+"""Unit tests for repository helpers."""
+
+import asyncio
+import uuid
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.repositories.database import bind_params
+from src.repositories.ids import generate_ids
+
+
+class TestGenerateIds:
+    """Tests for batched ID generation."""
+
+    def test_returns_requested_count(self):
+        """Should return exactly `count` IDs."""
+        assert len(generate_ids(5)) == 5
+        assert generate_ids(0) == []
+
+    def test_ids_are_valid_uuid4(self):
+        """IDs should be dashed 36-char UUID4 strings."""
+        for value in generate_ids(10):
+            assert len(value) == 36
+            assert uuid.UUID(value).version == 4
+
+    def test_ids_are_unique(self):
+        """IDs from one batch should not repeat."""
+        ids = generate_ids(100)
+        assert len(set(ids)) == 100
+
+
+class TestBindParams:
+    """Tests for pyformat to qmark translation."""
+
+    def test_replaces_placeholders_with_qmarks(self):
+        """Named placeholders should become positional qmarks."""
+        sql, params = bind_params(
+            "SELECT * FROM t WHERE a = %(a)s AND b = %(b)s",
+            {"b": 2, "a": 1},
+        )
+        
+        assert sql == "SELECT * FROM t WHERE a = ? AND b = ?"
+        assert params == (1, 2)
+
+    def test_repeated_placeholder_is_bound_each_time(self):
+        """A name used twice should appear twice in the parameter tuple."""
+        sql, params = bind_params("SELECT %(x)s + %(x)s", {"x": 3})
+        
+        assert sql == "SELECT ? + ?"
+        assert params == (3, 3)
+
+    def test_query_without_params(self):
+        """Queries without placeholders should bind an empty tuple."""
+        assert bind_params("SELECT 1") == ("SELECT 1", ())
+
+    def test_sql_is_normalized(self):
+        """Indentation, newlines and comments should collapse to single spaces."""
+        sql, _ = bind_params("""
+            SELECT a,   -- the id
+                b
+            FROM t
+            WHERE a = %(a)s
+        """, {"a": 1})
+        
+        assert sql == "SELECT a, b FROM t WHERE a = ?"
+
+    def test_quoted_text_is_preserved(self):
+        """Whitespace and dashes inside quotes should be left alone."""
+        sql, _ = bind_params("SELECT  'a  --b'  AS \"My  Col\"  FROM t")
+        
+        assert sql == "SELECT 'a  --b' AS \"My  Col\" FROM t"
+
+
+class TestExperimentCache:
+    """Tests for the experiment/variant read cache."""
+
+    def setup_method(self):
+        """Start every test with empty caches."""
+        from src.repositories import experiment
+        experiment._experiment_cache.clear()
+        experiment._variants_cache.clear()
+        experiment._experiment_ids_by_name.clear()
+
+    def _fake_query(self, query, params=None, query_name="unknown"):
+        row = {
+            "id": params["id"],
+            "name": "exp",
+            "description": None,
+            "status": "active",
+            "created_at": None,
+            "updated_at": None,
+            "variant_created_at": None,
+        }
+        return [
+            {**row, "variant_id": "var_001", "variant_name": "control", "variant_is_control": True},
+            {**row, "variant_id": "var_002", "variant_name": "variant_a", "variant_is_control": False},
+        ]
+
+    def test_second_read_is_served_from_cache(self):
+        """Repeated reads should hit the database only once."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        with patch("src.repositories.experiment.execute_query", side_effect=self._fake_query) as mock_query:
+            first = ExperimentRepository.get_experiment_by_id("exp_123")
+            second = ExperimentRepository.get_experiment_by_id("exp_123")
+        
+        assert first == second
+        assert mock_query.call_count == 1
+
+    def test_cached_result_is_not_shared(self):
+        """Mutating a returned record should not affect the cache."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        with patch("src.repositories.experiment.execute_query", side_effect=self._fake_query):
+            first = ExperimentRepository.get_experiment_by_id("exp_123")
+            first["status"] = "paused"
+            first["variants"][0]["name"] = "changed"
+            second = ExperimentRepository.get_experiment_by_id("exp_123")
+        
+        assert second["status"] == "active"
+        assert second["variants"][0]["name"] == "control"
+
+    def test_update_status_invalidates_cache(self):
+        """Status updates should force the next read to hit the database."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        with patch("src.repositories.experiment.execute_query", side_effect=self._fake_query) as mock_query, \
+                patch("src.repositories.experiment.execute_write", return_value=1):
+            ExperimentRepository.get_experiment_by_id("exp_123")
+            ExperimentRepository.update_status("exp_123", "paused")
+            ExperimentRepository.get_experiment_by_id("exp_123")
+        
+        assert mock_query.call_count == 2
+
+    def test_variants_are_grouped_from_joined_rows(self):
+        """Joined rows should collapse into one experiment with nested variants."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        with patch("src.repositories.experiment.execute_query", side_effect=self._fake_query):
+            experiment = ExperimentRepository.get_experiment_by_id("exp_123")
+        
+        assert experiment["id"] == "exp_123"
+        assert [v["id"] for v in experiment["variants"]] == ["var_001", "var_002"]
+        assert experiment["variants"][0]["is_control"] is True
+        assert "variant_id" not in experiment
+
+    def test_experiment_without_variants(self):
+        """A LEFT JOIN row with NULL variant columns should yield no variants."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        row = {
+            "id": "exp_123", "name": "exp", "description": None, "status": "active",
+            "created_at": None, "updated_at": None, "variant_id": None,
+            "variant_name": None, "variant_is_control": None, "variant_created_at": None,
+        }
+        with patch("src.repositories.experiment.execute_query", return_value=[row]):
+            experiment = ExperimentRepository.get_experiment_by_id("exp_123")
+        
+        assert experiment["variants"] == []
+
+    def test_name_lookup_is_cached(self):
+        """Repeated lookups by name should hit the database only once."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        record = {"id": "exp_123", "name": "exp", "status": "active"}
+        with patch("src.repositories.experiment.execute_query", return_value=[record]) as mock_query:
+            first = ExperimentRepository.get_experiment_by_name("exp")
+            second = ExperimentRepository.get_experiment_by_name("exp")
+        
+        assert first == second == record
+        assert mock_query.call_count == 1
+
+    def test_name_lookup_reuses_id_lookup(self):
+        """A lookup by ID should also serve the next lookup by name."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        with patch("src.repositories.experiment.execute_query", side_effect=self._fake_query) as mock_query:
+            ExperimentRepository.get_experiment_by_id("exp_123")
+            experiment = ExperimentRepository.get_experiment_by_name("exp")
+        
+        assert experiment["id"] == "exp_123"
+        assert mock_query.call_count == 1
+
+    def test_update_status_invalidates_name_lookup(self):
+        """Status updates should not leave a stale record behind the name."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        record = {"id": "exp_123", "name": "exp", "status": "active"}
+        with patch("src.repositories.experiment.execute_query", return_value=[record]) as mock_query, \
+                patch("src.repositories.experiment.execute_write", return_value=1):
+            ExperimentRepository.get_experiment_by_name("exp")
+            ExperimentRepository.update_status("exp_123", "paused")
+            ExperimentRepository.get_experiment_by_name("exp")
+        
+        assert mock_query.call_count == 2
+
+    def test_missing_experiment_is_not_cached(self):
+        """Unknown IDs should be looked up again on the next call."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        with patch("src.repositories.experiment.execute_query", return_value=[]) as mock_query:
+            assert ExperimentRepository.get_experiment_by_id("missing") is None
+            assert ExperimentRepository.get_experiment_by_id("missing") is None
+        
+        assert mock_query.call_count == 2
+
+
+class TestActiveExperimentIds:
+    """Tests for the active experiment listing."""
+
+    def test_returns_ids_in_query_order(self):
+        """Should return a flat list of IDs."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        rows = [{"id": "exp_1"}, {"id": "exp_2"}]
+        with patch("src.repositories.experiment.execute_query", return_value=rows) as mock_query:
+            assert ExperimentRepository.get_active_experiment_ids() == ["exp_1", "exp_2"]
+        
+        assert "status = 'active'" in mock_query.call_args.args[0]
+
+
+class TestSaveAllocation:
+    """Tests for allocation history writes."""
+
+    def test_all_variants_go_in_one_insert(self):
+        """Variants should be nested in one row, parsed server-side."""
+        import json
+        from datetime import datetime
+        from src.repositories.allocation_history import AllocationHistoryRepository
+        
+        variants = [
+            {"variant_name": "control", "impressions": 100, "clicks": 3},
+            {"variant_name": "variant_a", "impressions": 100, "clicks": 5},
+        ]
+        with patch("src.repositories.allocation_history.execute_write") as mock_write:
+            AllocationHistoryRepository.save_allocation(
+                experiment_id="exp_1",
+                computed_at=datetime(2026, 1, 15),
+                window_days=14,
+                algorithm="thompson_sampling",
+                algorithm_version="1.8.0",
+                seed=42,
+                used_fallback=False,
+                variants=variants,
+            )
+        
+        mock_write.assert_called_once()
+        query, params = mock_write.call_args.args
+        assert "VALUES" not in query
+        assert "SELECT" in query and "PARSE_JSON" in query
+        assert json.loads(params["allocations"]) == variants
+        assert (params["total_impressions"], params["total_clicks"]) == (200, 8)
+
+
+class TestCreateExperiment:
+    """Tests for experiment creation writes."""
+
+    def test_experiment_and_variants_share_one_transaction(self):
+        """Experiment and all variants should be written in one transaction."""
+        from src.repositories.experiment import ExperimentRepository
+        
+        with patch("src.repositories.experiment.transaction") as mock_transaction:
+            cursor = mock_transaction.return_value.__enter__.return_value
+            result = ExperimentRepository.create_experiment(
+                name="exp",
+                description=None,
+                variants=[
+                    {"name": "control", "is_control": True},
+                    {"name": "variant_a", "is_control": False},
+                    {"name": "variant_b", "is_control": False},
+                ],
+            )
+        
+        mock_transaction.assert_called_once()
+        cursor.execute.assert_called_once()
+        cursor.executemany.assert_called_once()
+        sql, rows = cursor.executemany.call_args[0]
+        assert "INSERT INTO variants" in sql
+        assert len(rows) == 3
+        assert all(row[1] == result["id"] for row in rows)
+        assert [v["id"] for v in result["variants"]] == [row[0] for row in rows]
+
+    def test_returned_timestamps_match_stored_values(self):
+        """Response timestamps should be the values bound to the inserts."""
+        from src.repositories.experiment import ExperimentRepository
+
+        with patch("src.repositories.experiment.transaction") as mock_transaction:
+            cursor = mock_transaction.return_value.__enter__.return_value
+            result = ExperimentRepository.create_experiment(
+                name="exp",
+                description=None,
+                variants=[
+                    {"name": "control", "is_control": True},
+                    {"name": "variant_a", "is_control": False},
+                ],
+            )
+
+        _, experiment_params = cursor.execute.call_args[0]
+        _, rows = cursor.executemany.call_args[0]
+        assert result["created_at"].tzinfo is None
+        assert tuple(experiment_params[-2:]) == (result["created_at"], result["updated_at"])
+        assert all(row[-1] == result["created_at"] for row in rows)
+        assert all(v["created_at"] == result["created_at"] for v in result["variants"])
+
+
+class TestInsertMetrics:
+    """Tests for metrics writes."""
+
+    def _insert(self, rows):
+        from src.repositories.metrics import MetricsRepository
+        
+        with patch("src.repositories.metrics.transaction") as mock_transaction:
+            cursor = mock_transaction.return_value.__enter__.return_value
+            MetricsRepository.insert_metrics_bulk("exp_123", rows)
+        return cursor
+
+    def _row(self, variant_id, clicks=5):
+        from datetime import date
+        return {
+            "variant_id": variant_id,
+            "metric_date": date(2026, 1, 15),
+            "impressions": 100,
+            "clicks": clicks,
+        }
+
+    def test_batch_is_one_multi_statement_request(self):
+        """Raw insert, daily upsert and updated_at bump should be one call."""
+        cursor = self._insert([self._row("var_001"), self._row("var_002")])
+        
+        cursor.execute.assert_called_once()
+        (sql, params), kwargs = cursor.execute.call_args
+        assert kwargs == {"num_statements": 3}
+        assert "INSERT INTO raw_metrics" in sql
+        assert "MERGE INTO daily_metrics" in sql
+        assert "UPDATE experiments" in sql
+        # Both VALUES lists are padded to the minimum batch size (8)
+        assert sql.count("?") == len(params) == 8 * 8 + 8 * 6 + 2
+        assert params[2 * 8:8 * 8] == (None,) * 6 * 8
+        assert params[-1] == "exp_123"
+        # ids are generated by Snowflake, not bound from Python
+        assert "UUID_STRING()" in sql
+        assert sql.count("WHERE column1 IS NOT NULL") == 2
+
+    def test_batch_lengths_share_statement_text(self):
+        """Batches padding to the same size should reuse one SQL text."""
+        from src.sql import MetricsQueries
+        
+        small = self._insert([self._row("var_001")])
+        larger = self._insert([self._row(f"var_00{i}") for i in range(5)])
+        
+        assert small.execute.call_args[0][0] == larger.execute.call_args[0][0]
+        assert [MetricsQueries.bulk_batch_size(n) for n in (1, 8, 9, 600)] == [8, 8, 16, 1024]
+
+    def test_daily_rows_keep_last_duplicate(self):
+        """Duplicate variant/date rows go to raw as-is but merge only once."""
+        cursor = self._insert([self._row("var_001", clicks=1), self._row("var_001", clicks=7)])
+        
+        (sql, params), _ = cursor.execute.call_args
+        assert len(params) == 8 * 8 + 8 * 6 + 2
+        daily_clicks = params[8 * 8 + 4]
+        assert daily_clicks == 7
+
+    def test_empty_batch_is_noop(self):
+        """An empty batch should not open a transaction."""
+        from src.repositories.metrics import MetricsRepository
+        
+        with patch("src.repositories.metrics.transaction") as mock_transaction:
+            MetricsRepository.insert_metrics_bulk("exp_123", [])
+        
+        mock_transaction.assert_not_called()
+
+
+class TestBulkCopyMetrics:
+    """Tests for the stage + COPY INTO ingestion path."""
+
+    def _copy(self, rows):
+        from src.repositories.metrics import MetricsRepository
+        
+        conn = MagicMock()
+        with patch("src.repositories.metrics.get_connection") as mock_get_connection:
+            mock_get_connection.return_value.__enter__.return_value = conn
+            MetricsRepository.bulk_copy_metrics("exp_123", rows)
+        return conn
+
+    def test_statements_run_in_order_on_one_connection(self):
+        """Stage, load, write and clean up should all use the same session."""
+        from datetime import date
+        
+        conn = self._copy([
+            {"variant_id": "var_001", "metric_date": date(2026, 1, 15), "impressions": 100, "clicks": 5},
+        ])
+        
+        statements = [c.args[0].split()[0:3] for c in conn.cursor.return_value.execute.call_args_list]
+        assert statements == [
+            ["CREATE", "OR", "REPLACE"],
+            ["PUT", "file://metrics_stage.csv", "@%metrics_stage"],
+            ["COPY", "INTO", "metrics_stage"],
+            ["INSERT", "INTO", "raw_metrics"],
+            ["MERGE", "INTO", "daily_metrics"],
+            ["UPDATE", "experiments", "SET"],
+            ["DROP", "TABLE", "IF"],
+        ]
+        conn.commit.assert_called_once()
+        conn.autocommit.assert_called_with(True)
+
+    def test_rows_are_sent_as_csv(self):
+        """The PUT should stream every row as CSV with a sequence number."""
+        from datetime import date
+        from decimal import Decimal
+        
+        conn = self._copy([
+            {"variant_id": "var_001", "metric_date": date(2026, 1, 15), "impressions": 100, "clicks": 5},
+            {
+                "variant_id": "var_002", "metric_date": date(2026, 1, 15), "impressions": 50,
+                "clicks": 2, "revenue": Decimal("1.50"), "source": "gam", "batch_id": "b1",
+            },
+        ])
+        
+        put_call = conn.cursor.return_value.execute.call_args_list[1]
+        csv_text = put_call.kwargs["file_stream"].getvalue().decode()
+        assert csv_text.splitlines() == [
+            "0,var_001,2026-01-15,0,100,5,0,api,",
+            "1,var_002,2026-01-15,0,50,2,1.50,gam,b1",
+        ]
+
+    def test_failed_write_rolls_back(self):
+        """A failing MERGE should roll back the raw insert too."""
+        from datetime import date
+        from src.repositories.metrics import MetricsRepository
+        
+        conn = MagicMock()
+        conn.cursor.return_value.execute.side_effect = [None, None, None, None, RuntimeError("boom")]
+        with patch("src.repositories.metrics.get_connection") as mock_get_connection:
+            mock_get_connection.return_value.__enter__.return_value = conn
+            with pytest.raises(RuntimeError):
+                MetricsRepository.bulk_copy_metrics("exp_123", [
+                    {"variant_id": "var_001", "metric_date": date(2026, 1, 15), "impressions": 1, "clicks": 0},
+                ])
+        
+        conn.rollback.assert_called_once()
+        conn.commit.assert_not_called()
+        conn.autocommit.assert_called_with(True)
+
+
+class TestMetricsForAllocationMany:
+    """Tests for the batched allocation metrics read."""
+
+    def test_rows_are_grouped_per_experiment(self):
+        """One query should serve every experiment, including empty ones."""
+        from src.repositories.metrics import MetricsRepository
+        
+        rows = [
+            {"experiment_id": "exp_1", "variant_id": "var_001"},
+            {"experiment_id": "exp_1", "variant_id": "var_002"},
+            {"experiment_id": "exp_2", "variant_id": "var_003"},
+        ]
+        with patch("src.repositories.metrics.execute_query", return_value=rows) as mock_query:
+            result = MetricsRepository.get_metrics_for_allocation_many(
+                ["exp_1", "exp_2", "exp_3", "exp_1"], window_days=14
+            )
+        
+        mock_query.assert_called_once()
+        query, params = mock_query.call_args.args
+        assert query.count("%(experiment_id_") == 3
+        assert params["window_days"] == 14
+        assert result == {
+            "exp_1": [{"variant_id": "var_001"}, {"variant_id": "var_002"}],
+            "exp_2": [{"variant_id": "var_003"}],
+            "exp_3": [],
+        }
+
+    def test_no_ids_skips_query(self):
+        """An empty ID list should not hit the database."""
+        from src.repositories.metrics import MetricsRepository
+        
+        with patch("src.repositories.metrics.execute_query") as mock_query:
+            assert MetricsRepository.get_metrics_for_allocation_many([]) == {}
+
+        mock_query.assert_not_called()
+
+    def test_multi_window_splits_one_query(self):
+        """Both windows should come from one query, in the single-window shape."""
+        from src.repositories.metrics import MetricsRepository
+
+        rows = [{
+            "variant_id": "var_001",
+            "variant_name": "control",
+            "is_control": True,
+            "impressions_0": 100, "clicks_0": 5, "ctr_0": 0.05,
+            "beta_alpha_0": 6, "beta_beta_0": 96,
+            "impressions_1": 300, "clicks_1": 9, "ctr_1": 0.03,
+            "beta_alpha_1": 10, "beta_beta_1": 292,
+        }]
+        with patch("src.repositories.metrics.execute_query", return_value=rows) as mock_query:
+            result = MetricsRepository.get_metrics_multi_window("exp_1", [14, 30])
+
+        mock_query.assert_called_once()
+        query, params = mock_query.call_args.args
+        assert "%(window_days_1)s" in query
+        assert params["window_days"] == 30
+        assert (params["window_days_0"], params["window_days_1"]) == (14, 30)
+        assert result[14] == [{
+            "variant_id": "var_001",
+            "variant_name": "control",
+            "is_control": True,
+            "impressions": 100,
+            "clicks": 5,
+            "ctr": 0.05,
+            "beta_alpha": 6,
+            "beta_beta": 96,
+        }]
+        assert result[30][0]["impressions"] == 300
+
+
+class TestExperimentHistory:
+    """Tests for the fused existence check + streamed history read."""
+
+    def _stream(self, rows):
+        from src.repositories.metrics import MetricsRepository
+        
+        with patch("src.repositories.metrics.stream_query", return_value=iter(rows)):
+            return MetricsRepository.stream_experiment_history("exp_123")
+
+    def test_unknown_experiment_returns_none(self):
+        """No rows should mean the experiment doesn't exist."""
+        assert self._stream([]) is None
+
+    def test_experiment_without_metrics_has_empty_history(self):
+        """A single row with NULL metrics should yield an empty history."""
+        name, history = self._stream([
+            {"experiment_name": "exp", "metric_date": None, "variant_id": None},
+        ])
+        
+        assert name == "exp"
+        assert list(history) == []
+
+    def test_history_rows_drop_experiment_name(self):
+        """History records should not repeat the experiment name."""
+        name, history = self._stream([
+            {"experiment_name": "exp", "variant_id": "var_001", "clicks": 3},
+            {"experiment_name": "exp", "variant_id": "var_002", "clicks": 5},
+        ])
+        
+        assert name == "exp"
+        assert list(history) == [
+            {"variant_id": "var_001", "clicks": 3},
+            {"variant_id": "var_002", "clicks": 5},
+        ]
+
+
+class TestConnectionPool:
+    """Tests for connection pooling and the per-request scope."""
+
+    def _fake_connect(self, **kwargs):
+        conn = MagicMock()
+        conn.is_closed.return_value = False
+        return conn
+
+    def test_released_connection_is_reused(self):
+        """A released connection should be handed out again."""
+        from src.repositories.database import ConnectionPool
+        
+        pool = ConnectionPool(size=2)
+        with patch("snowflake.connector.connect", side_effect=self._fake_connect) as mock_connect:
+            first = pool.acquire()
+            pool.release(first)
+            second = pool.acquire()
+        
+        assert second is first
+        assert mock_connect.call_count == 1
+
+    def test_extra_connections_are_closed(self):
+        """Releasing beyond the pool size should close the connection."""
+        from src.repositories.database import ConnectionPool
+        
+        pool = ConnectionPool(size=1)
+        with patch("snowflake.connector.connect", side_effect=self._fake_connect):
+            first, second = pool.acquire(), pool.acquire()
+            pool.release(first)
+            pool.release(second)
+        
+        first.close.assert_not_called()
+        second.close.assert_called_once()
+
+    def test_closed_connections_are_dropped(self):
+        """Connections closed while idle should not be handed out."""
+        from src.repositories.database import ConnectionPool
+        
+        pool = ConnectionPool(size=2)
+        with patch("snowflake.connector.connect", side_effect=self._fake_connect):
+            stale = pool.acquire()
+            pool.release(stale)
+            stale.is_closed.return_value = True
+            fresh = pool.acquire()
+        
+        assert fresh is not stale
+
+    def test_request_scope_shares_one_connection(self):
+        """All queries in a request scope should use the same connection."""
+        from src.repositories import database
+        
+        async def handle_request():
+            scope = database.request_connection_scope()
+            await scope.__anext__()
+            with database.get_connection() as first, database.get_connection() as second:
+                pass
+            await scope.aclose()
+            return first, second
+        
+        with patch.object(database, "pool") as mock_pool:
+            mock_pool.acquire.side_effect = lambda: self._fake_connect()
+            first, second = asyncio.run(handle_request())
+        
+        assert first is second
+        mock_pool.acquire.assert_called_once()
+        mock_pool.release.assert_called_once_with(first)
+
+    def test_request_scope_without_queries_takes_no_connection(self):
+        """Requests that never query should not check out a connection."""
+        from src.repositories import database
+        
+        async def handle_request():
+            scope = database.request_connection_scope()
+            await scope.__anext__()
+            await scope.aclose()
+        
+        with patch.object(database, "pool") as mock_pool:
+            asyncio.run(handle_request())
+        
+        mock_pool.acquire.assert_not_called()
+        mock_pool.release.assert_not_called()
+
+    def test_stream_query_fetches_in_batches_and_releases(self):
+        """Streamed rows should be fetched lazily and the connection returned."""
+        from src.repositories import database
+        
+        conn = self._fake_connect()
+        cursor = conn.cursor.return_value
+        cursor.description = [("A",), ("B",)]
+        cursor.fetchmany.side_effect = [[(1, 2), (3, 4)], [(5, 6)], []]
+        
+        with patch.object(database, "pool") as mock_pool:
+            mock_pool.acquire.return_value = conn
+            rows = database.stream_query("SELECT a, b FROM t", batch_size=2)
+            assert next(rows) == {"a": 1, "b": 2}
+            assert cursor.fetchmany.call_count == 1
+            assert list(rows) == [{"a": 3, "b": 4}, {"a": 5, "b": 6}]
+        
+        mock_pool.release.assert_called_once_with(conn)
@@ -0,0 +1,49 @@
+"""Unit tests for JSON serialization helpers."""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+import orjson
+import pytest
+
+from src.serialization import OrjsonResponse, dumps
+
+
+class TestDumps:
+    """Tests for orjson-backed encoding."""
+
+    def test_encodes_dates_and_decimals(self):
+        """Dates should be ISO strings and Decimals plain numbers."""
+        payload = {
+            "metric_date": date(2025, 1, 15),
+            "computed_at": datetime(2025, 1, 15, 12, 30),
+            "ctr": Decimal("0.032000"),
+        }
+        
+        assert orjson.loads(dumps(payload)) == {
+            "metric_date": "2025-01-15",
+            "computed_at": "2025-01-15T12:30:00",
+            "ctr": 0.032,
+        }
+
+    def test_encodes_numpy_arrays(self):
+        """Numpy arrays should serialize without conversion to lists."""
+        assert dumps({"p": np.array([0.25, 0.75])}) == b'{"p":[0.25,0.75]}'
+
+    def test_rejects_unknown_types(self):
+        """Unsupported types should still raise."""
+        with pytest.raises(TypeError):
+            dumps({"value": object()})
+
+
+class TestOrjsonResponse:
+    """Tests for the orjson response class."""
+
+    def test_renders_with_dumps(self):
+        """Response bodies should match `dumps` output."""
+        response = OrjsonResponse({"ctr": Decimal("0.5")}, status_code=500)
+        
+        assert response.body == b'{"ctr":0.5}'
+        assert response.status_code == 500
+        assert response.headers["content-type"] == "application/json"